@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Check that the bin/ entry points load heavy dependencies lazily
+
+Each script in bin/ is run with 'python -X importtime <script> --help' in
+a fresh interpreter, so what is measured is whatever the script actually
+imports before it parses its arguments. A script fails if any heavy
+dependency (see HEAVY) is imported; the exit status is non-zero if any
+script fails. This check does not depend on the speed of the machine.
+
+For information, the cumulative time of all top-level imports is reported
+relative to a bare interpreter ('python -c pass'), along with the wall time
+of the --help run.
+
+Usage:
+  python benchmarks/importtime.py [--repeat N]
+
+"""
+
+import argparse
+import os, sys, time
+from subprocess import run, PIPE, DEVNULL
+
+ROOT  = os.path.dirname( os.path.dirname( os.path.abspath(__file__) ) )
+BIN   = os.path.join( ROOT, 'bin' )
+HEAVY = ('regex', 'docx', 'pylatexenc', 'watchdog', 'pandoc')                   # Must not be imported before arguments are parsed
+
+def importTime( *args ):
+  """
+  Run Python with -X importtime in a fresh interpreter
+
+  Arguments:
+    *args : Script and its arguments, or other interpreter arguments;
+      none for a bare interpreter
+
+  Keyword arguments:
+    None.
+
+  Returns:
+    tuple : Cumulative time, in ms, of all top-level imports (including
+      those done at interpreter startup), set of top-level package names
+      imported, and wall time of the run, in ms
+
+  """
+
+  env  = dict( os.environ, PYTHONPATH = ROOT )
+  t0   = time.perf_counter()
+  proc = run( [sys.executable, '-X', 'importtime', *(args or ('-c', 'pass'))],
+              stdout = DEVNULL, stderr = PIPE, env = env, cwd = ROOT )
+  wall = (time.perf_counter() - t0) * 1000.0
+  if proc.returncode != 0:
+    raise Exception( proc.stderr.decode().splitlines()[-1] )
+
+  total  = 0
+  loaded = set()
+  for line in proc.stderr.decode().splitlines():
+    if not line.startswith('import time:'):
+      continue
+    _, cumulative, name = line[12:].split('|')
+    if not cumulative.strip().isdigit():                                        # Header line
+      continue
+    loaded.add( name.strip().split('.')[0] )
+    if not name[1:].startswith(' '):                                            # Top-level import; nested ones are indented
+      total += int( cumulative )
+  return total / 1000.0, loaded, wall
+
+def main():
+  parser = argparse.ArgumentParser( description = 'Check lazy imports of pyLaTeX entry points' )
+  parser.add_argument('--repeat', type=int, default=5, help='Number of runs; minimum time is reported')
+  args = parser.parse_args()
+
+  bare   = min( importTime()[0] for _ in range(args.repeat) )
+  failed = False
+  print( f'{"entry point":<14} {"import [ms]":>12} {"x bare":>7} {"--help [ms]":>12}  heavy modules loaded' )
+  for script in sorted( os.listdir( BIN ) ):
+    try:
+      runs = [importTime( os.path.join(BIN, script), '--help' ) for _ in range(args.repeat)]
+    except Exception as err:
+      print( f'{script:<14} skipped: {err}' )
+      continue
+    imp    = min( run[0] for run in runs )
+    wall   = min( run[2] for run in runs )
+    heavy  = sorted( set(HEAVY).intersection( runs[0][1] ) )
+    failed = failed or len(heavy) > 0
+    print( f'{script:<14} {imp:12.1f} {imp / bare:7.2f} {wall:12.1f}  {", ".join(heavy) + "  FAIL" if heavy else "-"}' )
+  print( f'{"bare python":<14} {bare:12.1f}' )
+  return 1 if failed else 0
+
+if __name__ == "__main__":
+  sys.exit( main() )
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Generate a synthetic LaTeX project for benchmarking
+
+The project is a book whose chapters are pulled in with \\include; each
+chapter \\input's a number of section files. Section files contain filler
+text with comments, figures, tables, and equations with captions and
+labels, references to those labels, acronym commands, and citations.
+Acronyms are declared in acronyms.tex, references are in refs.bib, and the
+ris/ directory holds one RIS file per reference for ris2bib. The output is
+deterministic for a given set of parameters and seed.
+
+Usage:
+  python benchmarks/synthetic.py OUTDIR [--chapters N] [--includes N] ...
+
+"""
+
+import argparse
+import os, sys
+import random
+
+# Default parameters of a generated project
+PARAMS = {
+  'chapters' : 10,                                                              # \include'd chapter files
+  'includes' : 4,                                                               # \input'ed section files per chapter
+  'floats'   : 200,                                                             # Figures, tables, and equations in total
+  'refs'     : 3,                                                               # References to each float label
+  'acronyms' : 100,                                                             # Acronyms declared; each is used several times
+  'bib'      : 500,                                                             # Entries in refs.bib; one citation each
+  'ris'      : 50,                                                              # RIS files to convert with ris2bib
+  'words'    : 400,                                                             # Filler words per section file
+}
+
+WORDS = ('lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod '
+         'tempor incididunt ut labore et dolore magna aliqua enim ad minim veniam '
+         'quis nostrud exercitation ullamco laboris nisi aliquip ex ea commodo').split()
+ENVS  = ('figure', 'table', 'equation')
+ACCMD = ('ac', 'ac', 'ac', 'acp', 'acs', 'acl', 'acf', 'Ac')
+
+def _words( rng, n ):
+  """Return n filler words"""
+
+  return ' '.join( rng.choice(WORDS) for _ in range(n) )
+
+def _float( env, label, rng ):
+  """Return source of a float with a caption and label"""
+
+  if env == 'equation':
+    return f'\\begin{{equation}}\n  E = m c^2 \\label{{{label}}}\n\\end{{equation}}\n'
+  body = '\\includegraphics{fig/placeholder}' if env == 'figure' else '\\begin{tabular}{cc} a & b \\\\ \\end{tabular}'
+  return (f'\\begin{{{env}}}\n  \\centering\n  {body}\n'
+          f'  \\caption{{{_words(rng, 12)}, see \\cite{{ref0}}}}\n  \\label{{{label}}}\n\\end{{{env}}}\n')
+
+def generate( outdir, seed = 0, **kwargs ):
+  """
+  Write a synthetic project
+
+  Arguments:
+    outdir (str) : Directory to write project to; created if needed
+
+  Keyword arguments:
+    seed (int) : Seed of random number generator
+    **kwargs : Parameters to override; see PARAMS
+
+  Returns:
+    str : Path to root TeX file
+
+  """
+
+  params = dict( PARAMS, **kwargs )
+  rng    = random.Random( seed )
+  os.makedirs( os.path.join( outdir, 'chapters' ), exist_ok = True )
+  os.makedirs( os.path.join( outdir, 'ris' ),      exist_ok = True )
+
+  sections = [(c, s) for c in range(params['chapters']) for s in range(params['includes'])]
+  labels   = [f'{ENVS[i % 3][:3]}:{i}' for i in range(params['floats'])]
+  acronyms = [f'acr{i}' for i in range(params['acronyms'])]
+  content  = {sec : [] for sec in sections}                                     # Section -> list of snippets
+
+  for i, label in enumerate( labels ):                                          # Floats spread evenly, refs anywhere
+    content[ sections[i % len(sections)] ].append( _float( ENVS[i % 3], label, rng ) )
+    for _ in range( params['refs'] ):
+      cmd = rng.choice( ('ref', 'eqref', 'autoref', 'cref') )
+      content[ rng.choice(sections) ].append( f'As shown in \\{cmd}{{{label}}}, {_words(rng, 8)}.\n' )
+  for acro in acronyms:
+    for _ in range( 4 ):
+      content[ rng.choice(sections) ].append( f'The \\{rng.choice(ACCMD)}{{{acro}}} {_words(rng, 6)}.\n' )
+  for i in range( params['bib'] ):
+    content[ rng.choice(sections) ].append( f'{_words(rng, 6)} \\cite{{ref{i}}}. % cite ref{i}\n' )
+
+  for c, s in sections:
+    snippets = content[(c, s)]
+    rng.shuffle( snippets )
+    text = [f'\\section{{Section {c}.{s}}}\n', f'% Section {c}.{s} of the synthetic document\n']
+    for snippet in snippets:
+      text.extend( [_words(rng, params['words'] // max(1, len(snippets))), '\n\n', snippet] )
+    with open( os.path.join( outdir, 'chapters', f'ch{c:02d}s{s:02d}.tex' ), 'w' ) as fid:
+      fid.write( ''.join(text) )
+
+  for c in range( params['chapters'] ):
+    with open( os.path.join( outdir, 'chapters', f'ch{c:02d}.tex' ), 'w' ) as fid:
+      fid.write( f'\\chapter{{Chapter {c}}}\n' )
+      for s in range( params['includes'] ):
+        fid.write( f'\\input{{chapters/ch{c:02d}s{s:02d}}}\n' )
+
+  with open( os.path.join( outdir, 'acronyms.tex' ), 'w' ) as fid:
+    for acro in acronyms:
+      fid.write( f'\\DeclareAcronym{{{acro}}}{{\n  short = {acro.upper()},\n  long  = {_words(rng, 3)}\n}}\n' )
+
+  with open( os.path.join( outdir, 'refs.bib' ), 'w' ) as fid:
+    for i in range( params['bib'] ):
+      fid.write( f'@article{{ref{i},\n  author  = {{Author, A. and Writer, B.}},\n'
+                 f'  title   = {{{_words(rng, 8)}}},\n  journal = {{Journal}},\n  year    = {{{1950 + i % 70}}}\n}}\n\n' )
+
+  for i in range( params['ris'] ):
+    with open( os.path.join( outdir, 'ris', f'ref{i}.ris' ), 'w' ) as fid:
+      fid.write( f'TY  - JOUR\nAU  - Author, A.\nAU  - Writer, B.\nPY  - {1950 + i % 70}\n'
+                 f'TI  - {_words(rng, 8)}\nJO  - Journal\nSP  - 1\nEP  - 10\nVL  - {i}\nER  - \n' )
+
+  root = os.path.join( outdir, 'main.tex' )
+  with open( root, 'w' ) as fid:
+    fid.write( '\\documentclass{book}\n\\usepackage{graphicx}\n\\usepackage{acro}\n'
+               '\\input{acronyms}\n'
+               '\\title{A Synthetic Document}\n\\authors{A. Author and B. Writer}\n'
+               f'\\abstract{{{_words(rng, 60)}}}\n'
+               '\\begin{document}\n\\maketitle\n' )
+    for c in range( params['chapters'] ):
+      fid.write( f'\\include{{chapters/ch{c:02d}}}\n' )
+    fid.write( '\\bibliographystyle{plain}\n\\bibliography{refs}\n\\end{document}\n' )
+  return root
+
+def main():
+  parser = argparse.ArgumentParser( description = 'Generate a synthetic LaTeX project' )
+  parser.add_argument('outdir', type=str, help='Directory to write project to')
+  parser.add_argument('--seed', type=int, default=0, help='Seed of random number generator')
+  for key, val in PARAMS.items():
+    parser.add_argument(f'--{key}', type=int, default=val, help=f'Default is {val}')
+  args = vars( parser.parse_args() )
+  print( generate( args.pop('outdir'), **args ) )
+  return 0
+
+if __name__ == "__main__":
+  sys.exit( main() )
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Time the Python transforms of pyLaTeX on a synthetic project
+
+A project is generated with synthetic.py in a temporary directory and each
+transform is timed on it; the minimum over all runs is reported. No TeX
+installation or pandoc is needed: pandoc is replaced by a Python process
+that echoes its input, so the _toMarkdown stage measures the transforms and
+the cost of piping the document through a subprocess.
+
+Baselines (in milliseconds) are read from transforms.json next to this
+file, along with the project parameters they were measured with and the
+regression threshold; the exit status is non-zero if any transform takes
+longer than its baseline times the threshold. Baselines are only compared
+when the project parameters match the stored ones.
+
+Usage:
+  python benchmarks/transforms.py [--repeat N] [--threshold X] [--update] [--chapters N] ...
+
+"""
+
+import argparse
+import json
+import logging
+import os, sys, time
+import tempfile
+
+from synthetic import PARAMS, generate
+
+ROOT      = os.path.dirname( os.path.dirname( os.path.abspath(__file__) ) )
+BASELINES = os.path.join( os.path.dirname( os.path.abspath(__file__) ), 'transforms.json' )
+THRESHOLD = 1.5                                                                 # Default allowed slowdown relative to baseline
+PANDOC    = [sys.executable, '-S', '-c',
+             'import sys; sys.stdout.buffer.write( sys.stdin.buffer.read() )']  # Stands in for pandoc; ignores its options
+
+sys.path.insert( 0, ROOT )
+from pyLaTeX import cache, utils                                                # noqa: E402
+from pyLaTeX.LaTeX import LaTeX, CROSSREF                                       # noqa: E402
+from pyLaTeX.ris2bib import ris2bib                                             # noqa: E402
+
+def timeit( func, repeat, reset = None ):
+  """
+  Time a function
+
+  Arguments:
+    func (callable) : Function to time; called without arguments
+    repeat (int) : Number of runs
+
+  Keyword arguments:
+    reset (callable) : Called, untimed, before every run, e.g., to clear
+      caches
+
+  Returns:
+    float : Minimum wall time of a run, in ms
+
+  """
+
+  best = float('inf')
+  for _ in range( repeat ):
+    if reset is not None: reset()
+    t0   = time.perf_counter()
+    func()
+    best = min( best, time.perf_counter() - t0 )
+  return best * 1000.0
+
+def benchmarks( outdir, **params ):
+  """
+  Generate a project and set up the transforms to time on it
+
+  Arguments:
+    outdir (str) : Directory to generate project in
+
+  Keyword arguments:
+    **params : Project parameters; see synthetic.PARAMS
+
+  Returns:
+    dict : Keys are names of transforms, values are (func, reset) tuples
+      for timeit()
+
+  """
+
+  cache.CACHEDIR = os.path.join( outdir, 'cache' )                              # Keep acronym cache out of the user cache
+  root  = generate( os.path.join( outdir, 'project' ), **params )
+  latex = LaTeX( root )
+  latex.PANDOC = PANDOC
+  text  = utils.removeComments( latex._text )
+  refs  = CROSSREF.process( text )
+  ris   = sorted( os.path.join( outdir, 'project', 'ris', f ) for f in os.listdir( os.path.join( outdir, 'project', 'ris' ) ) )
+  bib   = os.path.join( outdir, 'ris.bib' )
+
+  def metadata():
+    latex.getTitle( text )
+    latex.getAuthors( text )
+    latex.getBibFile( text )
+    latex.insertAbstract( text )
+
+  def convert():
+    for path in ris:
+      ris2bib( path, outfile = bib )
+
+  def reset():
+    latex._index = None
+
+  return {
+    'replaceInputs'  : (lambda: utils.replaceInputs( root ),  utils.FILECACHE.clear),
+    'removeComments' : (lambda: utils.removeComments( latex._text ), None),
+    'crossref'       : (lambda: CROSSREF.process( text ),       None),
+    'subAcros'       : (lambda: latex.subAcros( refs ),         None),
+    'metadata'       : (metadata,                               reset),
+    'ris2bib'        : (convert,                                lambda: os.path.isfile(bib) and os.remove(bib)),
+    '_toMarkdown'    : (lambda: latex._toMarkdown(),            reset),
+  }
+
+def main():
+  parser = argparse.ArgumentParser( description = 'Benchmark pyLaTeX transforms on a synthetic project' )
+  parser.add_argument('--repeat',    type=int,   default=5, help='Number of runs; minimum is reported')
+  parser.add_argument('--threshold', type=float, help='Allowed slowdown relative to baseline; default is stored value, or 1.5')
+  parser.add_argument('--update',    action='store_true', help='Write measured times as the new baselines')
+  parser.add_argument('--seed',      type=int,   default=0, help='Seed for project generation')
+  for key, val in PARAMS.items():
+    parser.add_argument(f'--{key}', type=int, default=val, help=f'Project parameter; default is {val}')
+  args   = parser.parse_args()
+  params = {key : getattr(args, key) for key in PARAMS}
+
+  stored = {}
+  if os.path.isfile( BASELINES ):
+    with open(BASELINES, 'r') as fid:
+      stored = json.load( fid )
+  threshold = args.threshold or stored.get('threshold', THRESHOLD)
+  baselines = stored.get('baselines', {})
+  if stored.get('params', params) != params or stored.get('seed', args.seed) != args.seed:
+    print( 'Project parameters differ from those of stored baselines; not comparing' )
+    baselines = {}
+
+  logging.disable( logging.WARNING )                                            # Undefined acronym warnings etc. are expected
+  failed  = False
+  results = {}
+  with tempfile.TemporaryDirectory() as tmp:
+    tests = benchmarks( tmp, seed = args.seed, **params )
+    print( f'{"transform":<16} {"time [ms]":>10} {"baseline [ms]":>14} {"ratio":>7}' )
+    for name, (func, reset) in tests.items():
+      ms    = timeit( func, args.repeat, reset )
+      base  = baselines.get( name, None )
+      ratio = ms / base if base else None
+      over  = ratio is not None and ratio > threshold
+      failed = failed or over
+      results[name] = ms
+      print( f'{name:<16} {ms:10.2f} {base if base else "-":>14} '
+             f'{f"{ratio:.2f}" if ratio else "-":>7}{"  REGRESSION" if over else ""}' )
+
+  if args.update:
+    with open(BASELINES, 'w') as fid:
+      json.dump( {'threshold' : threshold,
+                  'seed'      : args.seed,
+                  'params'    : params,
+                  'baselines' : {key : round(val, 2) for key, val in results.items()}},
+                 fid, indent = 2 )
+    return 0
+  return 1 if failed else 0
+
+if __name__ == "__main__":
+  sys.exit( main() )
@@ -1,57 +1,180 @@
 import logging
 import os, re
+import shutil
 import tempfile
+import time
+from threading import Thread, Lock
+from contextlib import nullcontext
 from subprocess import Popen, PIPE, STDOUT, DEVNULL
 
 from .acronyms import Acronyms
-from .crossref import CrossRef
+from .cache import DocState, hashFile, hashText
+from .crossref import CrossRef, CrossRefEngine
+from .depindex import chapters
+from .metrics import BuildResult, active, stage, record, waitProcess
+from .passes import PassScheduler
+from .preamble import PreambleFormat
+from .recorder import parseRecorder, buildManifest, manifestChanged
 from .utils import removeComments 
 
 # Environments for cross referencing
-ENVIRONS = [CrossRef('Figure', 'figure', 'warpfigure'),
-            CrossRef('Table',  'table'),
-            CrossRef('eq',     'equation')]
+ENVIRONS = [CrossRef('Figure',   'figure', 'warpfigure'),
+            CrossRef('Table',    'table'),
+            CrossRef('Equation', 'equation')]
+CROSSREF = CrossRefEngine( *ENVIRONS )
+
+AUXINPUT = re.compile( r'\\@input{([^}]+)}' )
+BIBLINES = re.compile( r'^\\(citation|bibdata|bibstyle|@input){([^}]*)}', re.MULTILINE )
+BIBCITE  = re.compile( r'\\bibcite{([^}]+)}' )
+BIBITEM  = re.compile( r'\\bibitem(?:\[[^\]]*\])?{([^}]+)}' )
+XREFS    = re.compile( r'\\(?:label|cite\w*|nocite|tableofcontents|listof\w+)\b' ) # Anything a fresh build needs a second pass for
+
+def auxLines(auxFile, cwd = None, _seen = None):
+  """
+  Read the BibTeX relevant lines of an aux file, following \\@input
+
+  Lines of aux files pulled in with \\@input (e.g., by \\include) are
+  inserted where the \\@input occurs, which is the order BibTeX reads
+  them in. A document compiled from one flattened file thus gives the
+  same lines as the same document split into included files.
+
+  Arguments:
+    auxFile (str) : Path to aux file
+
+  Keyword arguments:
+    cwd (str) : Directory \\@input paths are relative to; default is
+      directory of auxFile
+
+  Returns:
+    list : (command, argument) tuples for \\citation, \\bibdata, and
+      \\bibstyle lines
+
+  """
+
+  if cwd   is None: cwd   = os.path.dirname( auxFile )
+  if _seen is None: _seen = set()
+  if auxFile in _seen or not os.path.isfile(auxFile):
+    return []
+  _seen.add( auxFile )
+
+  with open(auxFile, 'r', errors='replace') as fid:
+    text = fid.read()
+  lines = []
+  for cmd, arg in BIBLINES.findall( text ):
+    if cmd == '@input':
+      lines.extend( auxLines( os.path.join(cwd, arg), cwd, _seen ) )
+    else:
+      lines.append( (cmd, arg) )
+  return lines
+
+def bibData(*args):
+  """
+  Extract the BibTeX relevant lines from aux file(s)
+
+  Only the \\citation, \\bibdata, and \\bibstyle lines of an aux file,
+  and of the aux files it \\@input's, affect the output of BibTeX, so
+  these are the only lines returned.
+
+  Arguments:
+    *args : Any number of paths to auxFiles
+
+  Keyword arguments:
+    None.
+
+  Returns:
+    dict : Keys are aux file paths, values are lists of (command, argument)
+      tuples in the order BibTeX reads them. Aux files without a
+      \\bibdata line of their own are not included.
 
-def auxCheck(*args, oldData = None):
   """
-  Check if aux file(s) has changed
 
-  This function will read in all the data from aux files and store
-  the data in a dictionary where keys are the file names/paths and
-  the values are the data.
+  data = {}
+  for auxFile in args:
+    if os.path.isfile(auxFile):
+      with open(auxFile, 'r', errors='replace') as fid:
+        own = BIBLINES.findall( fid.read() )
+      if any( cmd == 'bibdata' for cmd, _ in own ):                             # Only aux files bibtex can be run on
+        data[auxFile] = auxLines( auxFile )
+  return data
+
+def citesPending(*args):
+  """
+  Check if the next pass will change the citation labels in aux file(s)
 
-  If the oldData is used, then the data read in from the aux files
-  is checked against the oldData. If the data are equal, then the
-  aux files have not changed, so there is no need for a long recompile
+  Each pass writes a \\bibcite line to the aux file for every \\bibitem in
+  the bbl file it read. If the bbl file, e.g., just written by BibTeX,
+  has other entries than the aux file has \\bibcite lines, the next pass
+  changes the aux file, so yet another pass is certain to follow it.
 
   Arguments:
     *args : Any number of paths to auxFiles
 
   Keyword arguments:
-    oldData (dict): If input, will check if newly read aux file data
-      matches data in the dictionary
+    None.
+
+  Returns:
+    bool : True if \\bibitem keys in bbl files differ from \\bibcite keys
+
+  """
+
+  cites = set()
+  items = set()
+  for auxFile in args:
+    if os.path.isfile(auxFile):
+      with open(auxFile, 'r', errors='replace') as fid:
+        cites.update( BIBCITE.findall( fid.read() ) )
+  for auxFile in bibData( *args ):
+    bblFile = '{}.bbl'.format( os.path.splitext(auxFile)[0] )
+    if os.path.isfile(bblFile):
+      with open(bblFile, 'r', errors='replace') as fid:
+        items.update( BIBITEM.findall( fid.read() ) )
+  return cites != items
+
+def mergeAux(auxFile, outFile):
+  """
+  Write an aux file, and the aux files it \\@input's, as one file
+
+  Arguments:
+    auxFile (str) : Path to aux file
+    outFile (str) : Path to merged aux file to create
+
+  Keyword arguments:
+    None.
 
   Returns:
-    dict, bool: If the oldData keyword is NOT used, then a dict 
-      containing the data from the aux files is returned. If the
-      oldData keyword IS used, then returns a bool of whether the
-      oldData matches the new data.
+    None.
 
   """
 
-  data = {}                                                                     # Dict for storing aux file data
-  for auxFile in args:                                                          # Iterate over all arguments
-    if os.path.isfile(auxFile):                                                 # If the path is a file
-      with open(auxFile, 'r') as fid:                                           # Open file for reading
-        data[auxFile] = fid.read()                                              # Store file data in data dict
-  if isinstance(oldData, dict):                                                 # If oldData is a dict 
-    return data == oldData                                                      # Return bool of whether data and oldData match
-  return data                                                                   # Return data
+  cwd   = os.path.dirname( auxFile )
+  seen  = set()
+  lines = []
+  def merge( path ):
+    if path in seen or not os.path.isfile(path): return
+    seen.add( path )
+    with open(path, 'r', errors='replace') as fid:
+      for line in fid:
+        match = AUXINPUT.match( line )
+        if match:
+          merge( os.path.join(cwd, match.group(1)) )
+        else:
+          lines.append( line )
+  merge( auxFile )
+  with open(outFile, 'w') as fid:
+    fid.writelines( lines )
 
 
 class LaTeX( Acronyms ):
   LATEXDIFF = ['latexdiff', '--append-context2cmd=abstract']
-  TEXOPTS   = ['-interaction=nonstopmode'] 
+  TEXOPTS   = ['-interaction=nonstopmode', '-recorder'] 
+  MAXPASSES = 5
+  DRAFTOPTS = {'pdflatex' : ['-draftmode'], 'xelatex' : ['-no-pdf']}           # Engine options to skip writing the PDF
+
+  def __init__(self, *args, **kwargs):
+    super().__init__(*args, **kwargs)
+    self.passes    = []                                                         # Reasons for each engine pass of last compile
+    self._auxFiles = {}                                                         # Cache of aux files for each TeX file compiled
+    self._building = Lock()                                                     # Held while the root document is compiled
 
   @property
   def PDFLATEX(self):
@@ -62,21 +185,145 @@ class LaTeX( Acronyms ):
   @property
   def BIBTEX(self):
     return [ os.path.join( self.texpath, 'bibtex') ]
+  @property
+  def XDVIPDFMX(self):
+    return [ os.path.join( self.texpath, 'xdvipdfmx') ]
+  @property
+  def KPSEWHICH(self):
+    return [ os.path.join( self.texpath, 'kpsewhich') ]
 
-  def _bibtex(self, auxFiles):
+  def _bibtex(self, auxFiles, cwd):
     """Generate list of bibtex commands to run for each aux file"""
 
-    return [self.BIBTEX + [os.path.basename(aux)] for aux in auxFiles]        # Set bibtex command
+    return [self.BIBTEX + [os.path.relpath(aux, cwd)] for aux in auxFiles]    # Set bibtex command
+
+  def _bibFiles(self, auxData, cwd):
+    """
+    Locate the .bib and .bst files named in aux files
+
+    Files not found relative to the compile directory are located using
+    kpsewhich.
+
+    Arguments:
+      auxData (dict) : Output from the bibData() function
+      cwd (str) : Directory that BibTeX is run in
+
+    Keyword arguments:
+      None.
+
+    Returns:
+      dict : Keys are file names as BibTeX sees them, values are paths;
+        paths of files that were not found do not exist
+
+    """
 
-  def _call(self, cmd, wait = True, **kwargs):
+    files = []
+    for entries in auxData.values():
+      for cmd, arg in entries:
+        if cmd == 'bibdata':
+          files.extend( [f'{name.strip()}.bib' for name in arg.split(',')] )
+        elif cmd == 'bibstyle':
+          files.append( f'{arg.strip()}.bst' )
+
+    paths   = {name : os.path.join(cwd, name) for name in files}
+    missing = [name for name, path in paths.items() if not os.path.isfile(path)]
+    if missing:                                                                 # Files not local; likely in TEXMF tree
+      try:
+        proc = self._call( self.KPSEWHICH + missing, cwd = cwd, stderr = DEVNULL, input = b'' )
+        for path in proc.output.decode().splitlines():
+          for name in missing:
+            if path.endswith( os.path.basename(name) ):
+              paths[name] = path
+      except Exception as err:
+        self.log.debug( f'Failed to locate bib files with kpsewhich: {err}' )
+    return paths
+
+  def _bibFingerprint(self, auxData, paths):
+    """
+    Compute fingerprint of everything that determines BibTeX output
+
+    The fingerprint covers the \\citation, \\bibdata, and \\bibstyle lines
+    of the aux files along with the contents of the referenced .bib and .bst
+    files.
+
+    Arguments:
+      auxData (dict) : Output from the bibData() function
+      paths (dict) : Output from the _bibFiles() method
+
+    Keyword arguments:
+      None.
+
+    Returns:
+      str : Hex digest
+
+    """
+
+    lines = []
+    for auxFile, entries in auxData.items():                                     # Aux file names not included, so builds of the same
+      lines.append( '' )                                                        # document under another jobname can share it
+      for cmd, arg in entries:
+        lines.append( f'\\{cmd}{{{arg}}}' )
+
+    for name in sorted(paths):
+      lines.append( f'{name}={hashFile(paths[name])}' )
+    return hashText( os.linesep.join(lines) )
+
+  def _runBibtex(self, auxFiles, state, **kwargs):
+    """
+    Run BibTeX if the citations or bibliography data have changed
+
+    Arguments:
+      auxFiles (list) : Aux files produced by the first pass
+      state (DocState) : Persistent state of document being compiled
+      **kwargs : Passed to the _call() method; must include cwd
+
+    Keyword arguments:
+      None.
+
+    Returns:
+      bool : True if BibTeX was run, False otherwise
+
+    """
+
+    cwd     = kwargs['cwd']
+    auxData = bibData( *auxFiles )
+    if not auxData:
+      self.log.debug( 'No bibliography data in aux file(s), no need for bibtex' )
+      state['bibinputs'] = []
+      return False
+
+    paths  = self._bibFiles( auxData, cwd )
+    digest = self._bibFingerprint( auxData, paths )
+    state['bibinputs'] = sorted( path for path in paths.values() if os.path.isfile(path) ) # Not in recorder data; see _saveManifest()
+    bbls   = [ '{}.bbl'.format( os.path.splitext(aux)[0] ) for aux in auxData ]
+    if digest == state.get('bibtex') and all( os.path.isfile(bbl) for bbl in bbls ):
+      self.log.debug( 'Citations and bibliography data unchanged, no need for bibtex' )
+      return False
+
+    ok = True
+    for bib in self._bibtex( auxData, cwd ):                                    # Generate bibtex commands and iterate over them
+      proc = self._call( bib, **kwargs )                                        # Run bibtex command
+      ok   = ok and proc.returncode < 2                                         # Return code of 1 is warnings only
+    state['bibtex'] = digest if ok else None                                    # Only remember fingerprint on success
+    state.save()
+    return True
+
+  def _call(self, cmd, wait = True, stage = None, input = None, **kwargs):
     """
     Run a given command using subprocess.Popen
 
+    The wall and CPU time of commands that are waited for are recorded
+    as a stage of the active BuildResult.
+
     Arguments:
       cmd (list,tuple): Command to run
 
     Keyword arguments:
       wait (bool): Set to wait for subprocess to finish. Default is to wait.
+      stage (str): Name of stage for timing; default is command name
+      input (bytes): Data to send to the command's stdin; if given, the
+        output of the command is captured and stored in the output
+        attribute of the returned object and the command is waited for
       **kwargs : Any keywords accepted by subprocess.Popen
 
     Returns:
@@ -85,10 +332,36 @@ class LaTeX( Acronyms ):
     """
 
     self.log.debug('Running command: {}'.format( cmd ))
+    if input is not None:
+      kwargs.update( stdin = PIPE, stdout = PIPE )
+    t0   = time.perf_counter()
     proc = Popen( cmd, **kwargs )
-    if wait: proc.wait()
+    if input is not None:                                                       # Feed stdin from a thread so pipes cannot deadlock
+      feed = Thread( target = self._feed, args = (proc.stdin, input) )
+      feed.start()
+      proc.output = proc.stdout.read()
+      proc.stdout.close()
+      feed.join()
+    if wait or input is not None:
+      cpu = waitProcess( proc )
+      record( stage or os.path.basename( cmd[0] ), time.perf_counter() - t0, cpu,
+              returncode = proc.returncode )
     return proc
 
+  @staticmethod
+  def _feed(pipe, data):
+    """Write data to a pipe and close it"""
+
+    try:
+      pipe.write( data )
+    except BrokenPipeError:
+      pass
+    finally:
+      try:
+        pipe.close()
+      except BrokenPipeError:
+        pass
+
   def _checkTeXFile(self, texfile):
     """
     Check texfile input 
@@ -110,28 +383,137 @@ class LaTeX( Acronyms ):
       return self.texfile                                                       # Set texfile to self.texfile
     return texfile                                                              # Return False
 
-  def findAuxFiles(self, texfile):
+  def _upToDate(self, texfile, latex, state):
     """
-    Recursively locate all aux files starting in self.texfile directory
+    Check if the output of a previous compile is still current
+
+    The dependency manifest built from the recorder data of the last
+    successful compile is compared with the files on disk. The compile
+    command and the PDF must also be unchanged.
 
     Arguments:
       texfile (str): Full path of TeX file to be compiled
+      latex (list): Engine command that would be run
+      state (DocState): Persistent state of the document
 
     Keyword arguments:
       None
 
+    Returns:
+      bool : True if nothing the document depends on has changed
+
+    """
+
+    manifest = state.get('manifest', None)
+    if not manifest or state.get('command', None) != latex:
+      return False
+
+    pdfFile = '{}.pdf'.format( os.path.splitext(texfile)[0] )
+    if not os.path.isfile( pdfFile ) or os.stat( pdfFile ).st_mtime_ns != state.get('pdf', None):
+      self.log.debug( 'PDF file missing or modified, must compile' )
+      return False
+
+    refreshed = []
+    changed   = manifestChanged( manifest, refreshed )
+    if changed:
+      self.log.debug( f'Dependency changed: {changed}' )
+      return False
+    if refreshed:                                                               # Store new stats of touched files
+      state.save()
+    return True
+
+  def _saveManifest(self, texfile, latex, state):
+    """Store recorder based dependency manifest of a successful compile"""
+
+    jobname = os.path.splitext(texfile)[0]
+    pdfFile = f'{jobname}.pdf'
+    state['manifest'] = buildManifest( f'{jobname}.fls', extra = state.get('bibinputs', ()) ) # BibTeX inputs are not in recorder data
+    state['command']  = latex
+    state['pdf']      = os.stat( pdfFile ).st_mtime_ns if os.path.isfile( pdfFile ) else None
+    state.save()
+
+  def _buildFormat(self, fmt, state, **kwargs):
+    """
+    Build the precompiled preamble format of a document if needed
+
+    Arguments:
+      fmt (PreambleFormat) : Format to build
+      state (DocState) : Persistent state of document being compiled
+      **kwargs : Passed to the _call() method; must include cwd
+
+    Keyword arguments:
+      None.
+
+    Returns:
+      bool : True if the format is ready to use, False otherwise
+
+    """
+
+    if fmt.isValid():
+      self.log.debug( f'Using preamble format: {fmt.path}' )
+      return True
+
+    self.log.info( f'Building preamble format: {fmt.path}' )
+    jobname = fmt.jobname()
+    proc    = self._call( fmt.command( jobname ), stage = 'format', **kwargs )
+    if proc.returncode == 0 and fmt.install( jobname ):
+      old = state.get( 'format', None )
+      if old and old != fmt.name:                                               # Preamble changed; old format not needed
+        fmt.remove( old )
+      state['format'] = fmt.name
+      state.pop( 'formatFailed', None )
+      ok = True
+    else:
+      self.log.warning( 'Failed to build preamble format, compiling full preamble' )
+      fmt.clean( jobname )
+      state['formatFailed'] = fmt.name                                          # Not tried again until preamble changes
+      ok = False
+    state.save()
+    return ok
+
+  def findAuxFiles(self, texfile, refresh = False):
+    """
+    Locate all aux files written when compiling a TeX file
+
+    The main aux file is read and any \\@input{} aux files (e.g., from
+    \\include) are followed recursively. Aux files listed as outputs in the
+    recorder (.fls) file are also included. Results are cached per TeX file
+    so that subsequent passes of a compile can reuse them.
+
+    Arguments:
+      texfile (str): Full path of TeX file to be compiled
+
+    Keyword arguments:
+      refresh (bool): Set to ignore cached result and search again
+
     Returns:
       list : Path(s) to aux files
 
     """
 
-    aux = []                                                                    # List for aux file paths
-    for root, dirs, items in os.walk( os.path.dirname( texfile ) ):             # Walk through the directory
-      for item in items:                                                        # Iterate over items
-        if item.endswith('.aux'):                                               # If file ends with aux
-          aux.append( os.path.join( root, item ) )                              # Build file path and append to aux list
+    if not refresh and texfile in self._auxFiles:                               # If already searched for this file
+      return list( self._auxFiles[texfile] )
+
+    fileDir = os.path.dirname( texfile )
+    jobname = os.path.splitext( texfile )[0]
+    aux     = []                                                                # List for aux file paths
+    stack   = [ f'{jobname}.aux' ]
+    while stack:                                                                # Follow the \@input chain
+      auxFile = stack.pop(0)
+      if auxFile in aux or not os.path.isfile( auxFile ):
+        continue
+      aux.append( auxFile )
+      with open(auxFile, 'r', errors='replace') as fid:
+        for path in AUXINPUT.findall( fid.read() ):                             # Paths are relative to compile directory
+          stack.append( os.path.normpath( os.path.join( fileDir, path ) ) )
+
+    for path in parseRecorder( f'{jobname}.fls' )[1]:                           # Aux files recorded as outputs
+      if path.endswith('.aux') and path not in aux and os.path.isfile( path ):
+        aux.append( path )
+
+    self._auxFiles[texfile] = aux
     self.log.debug( f'Aux file(s): {aux}' )
-    return aux                                                                  # Return list of aux files
+    return list( aux )                                                          # Return list of aux files
 
   def compile(self, texfile = None, **kwargs):
     """
@@ -144,18 +526,50 @@ class LaTeX( Acronyms ):
       texfile (str): Path to file to convert; not required if a file was
         specified when the class was initialized
       texlive (str): TeXLive version to use to compile
+      maxPasses (int): Maximum number of engine passes to run; default
+        is the MAXPASSES class attribute
+      force (bool): Compile even if no dependencies have changed since
+        the last successful compile
+      draft (bool): Run passes that are certain not to be the last
+        without writing the PDF (-draftmode for pdflatex): the first pass
+        of a fresh build of a document with labels, citations, or lists,
+        and the pass after BibTeX changed the cited entries. Other passes,
+        including the last one maxPasses allows, write the PDF, so no
+        extra pass is needed. With xelatex, all passes write only an xdv
+        file that is converted to PDF once, after the last pass
+      only (list): Paths of changed files; if all are part of \\include'd
+        files, only those are compiled (see _partialBuild), writing
+        <name>_partial.pdf. Otherwise, the full document is compiled
+      preamble (bool): Compile using a format with the preamble
+        precompiled; the format is (re)built when the preamble, or a file
+        it reads, changes
       **kwargs: 
     
     Returns:
-      bool : True if compile success, False otherwise
+      BuildResult : True if compile success, False otherwise; includes
+        timings of all passes and other commands run
 
     """
 
     texfile = self._checkTeXFile( texfile )
+    lock    = self._building if os.path.abspath( texfile ) == self.texfile else nullcontext()
+    with lock, BuildResult( 'compile', texfile ) as result:                     # See trackChanges() for why root builds are locked
+      result.success = self._compile( texfile, **kwargs )
+    self.passes = result.passes
+    return result
+
+  def _compile(self, texfile, **kwargs):
+    """Compile texfile; see compile()"""
+
+    only    = kwargs.pop( 'only', None )
+    if only:
+      partial = self._partialBuild( texfile, only )
+      if partial:
+        return self._compile( partial, **kwargs )
 
     fileDir, fileBase = os.path.split( texfile )                                # Get texfile directory
-    auxFiles = self.findAuxFiles( texfile )
-    oldData  = auxCheck( *auxFiles )
+    auxFiles = self.findAuxFiles( texfile, refresh = True )
+    state    = DocState( texfile )
 
     if kwargs.get('xelatex', False):                                            # If the xelatex keyword is set
       latex = self.XELATEX                                                      # Use xelatex
@@ -163,31 +577,83 @@ class LaTeX( Acronyms ):
       latex = self.XELATEX                                                      # Use xelatex
     else:                                                                       # Else
       latex = self.PDFLATEX                                                     # Use pdflatex
-    latex += self.TEXOPTS + [fileBase]                                          # Append options and file name
+    fmt    = PreambleFormat( texfile, latex[0] ) if kwargs.get('preamble', False) else None
+    if fmt is not None and (fmt.name is None or fmt.name == state.get('formatFailed', None)):
+      fmt  = None                                                               # No preamble, or format known not to build
+    latex += self.TEXOPTS + ([fmt.option()] if fmt else []) + [fileBase]        # Append options and file name
 
     kwargsCMD = {'cwd' : fileDir, 'stdout' : DEVNULL, 'stderr' : STDOUT}        # Set basic keywords for running command
     if kwargs.get('debug', False):                                              # If the debug keyword was set
       kwargsCMD['stdout'] = None                                                # Change stdout so will print for user
       kwargsCMD['stderr'] = None                                                # Change stderr so will pring for user
 
-    self.log.info( f'Compiling TeX file: {texfile}' )
+    upToDate = fmt is None or fmt.isValid()                                     # Files read into format are not in the recorder data
+    if not kwargs.get('force', False) and upToDate and self._upToDate( texfile, latex, state ):
+      self.log.info( f'Nothing changed, skipping compile: {texfile}' )
+      if kwargs.get('with_bbl', False):
+        self._insertBib()
+      return True
 
-    for i in range(3):
-      proc = self._call( latex, **kwargsCMD )                                   # Run a command
-      if proc.returncode != 0:                                                  # If command does NOT contain bibtex and it did NOT finish cleanly
-        self.log.error( 'There was an error compiling: {}'.format(latex) )      # Log error
-        return False                                                            # Return from method
-      elif (i == 0):                                                            # Else, if is the first command run
-        auxFiles = self.findAuxFiles( texfile )                                 # Find aux files
-        if auxCheck(*auxFiles, oldData=oldData) is True:                        # Check the aux file data for changes; note that will return False if no aux files existed at begining of compile
-          self.log.debug('Aux file(s) unchanged, no need for long compile')     # Log
-          break                                                                 # Break from loop as no need to keep compiling; not much changed
-        else:                                                                   # Else, if only 3 commands in cmd list, then there were no aux files at start of compile
-          for bib in self._bibtex(auxFiles):                                    # Generate bibtex commands and iterate over them
-            proc = self._call( bib, **kwargsCMD )                               # Run bibtex command
+    self.log.info( f'Compiling TeX file: {texfile}' )
+    if fmt is not None:
+      if self._buildFormat( fmt, state, **kwargsCMD ):
+        kwargsCMD['env'] = fmt.env()
+      else:                                                                     # Fall back to compiling the full preamble
+        latex.remove( fmt.option() )
+
+    draftCmd = None
+    engine   = os.path.basename( latex[0] )
+    if kwargs.get('draft', False) and engine in self.DRAFTOPTS:                 # Intermediate passes without PDF output
+      draftCmd = latex[:-1] + self.DRAFTOPTS[engine] + latex[-1:]
+    rerun    = not auxFiles and XREFS.search( self._text ) is not None           # Fresh build writes aux data a second pass reads
+
+    scheduler = PassScheduler( texfile, kwargs.get('maxPasses', None) or self.MAXPASSES )
+    reasons   = ['initial pass']
+    while True:
+      scheduler.start( reasons, auxFiles )                                      # Record state of aux files before pass
+      last  = len(scheduler.passes) >= scheduler.maxPasses                      # No pass can follow this one
+      draft = draftCmd is not None and (engine == 'xelatex' or (rerun and not last)) # Write PDF unless another pass is certain
+      cmd   = draftCmd if draft else latex
+      proc  = self._call( cmd, **kwargsCMD )                                    # Run a command
+      if proc.returncode != 0:                                                  # If command did NOT finish cleanly
+        return self._compileFailed( cmd, scheduler, state )
+      auxFiles = self.findAuxFiles( texfile, refresh = len(scheduler.passes) == 1 ) # Find aux files after first pass; reuse after that
+      reasons  = scheduler.check( auxFiles )                                    # Check log and aux files for rerun signals
+      rerun    = False
+      if len(scheduler.passes) == 1:                                            # If is the first pass
+        if self._runBibtex( auxFiles, state, **kwargsCMD ):                     # Run bibtex if citations or bib files changed
+          reasons.append( 'bibtex ran' )
+          rerun = citesPending( *auxFiles )                                     # Next pass changes \bibcite lines, so is not last
+      if scheduler.converged( reasons ):                                        # If no more passes needed, or hit maximum
+        break
+
+    if draft and engine == 'xelatex':                                           # Convert output of last pass to PDF
+      cmd  = self.XDVIPDFMX + ['{}.xdv'.format( os.path.splitext(fileBase)[0] )]
+      proc = self._call( cmd, **kwargsCMD )
+      if proc.returncode != 0:
+        return self._compileFailed( cmd, scheduler, state )
+    elif draft:                                                                 # Last pass wrote no PDF; run one that does, which
+      scheduler.start( 'PDF output', auxFiles )                                 # is within maxPasses as the last one never drafts
+      proc = self._call( latex, **kwargsCMD )
+      if proc.returncode != 0:
+        return self._compileFailed( latex, scheduler, state )
+    active().passes = scheduler.passes
+    self.log.info( f'Compiled in {len(scheduler.passes)} pass(es)' )
+    state['includes'] = list( chapters( texfile ) )                             # Structure a partial build must match
+    self._saveManifest( texfile, latex, state )
 
     if kwargs.get('with_bbl', False):                                           # If the with_bbl keyword is set
       self._insertBib()                                                         # Insert contents of bbl file into the document
+    return True
+
+  def _compileFailed(self, cmd, scheduler, state):
+    """Log a failed compile and make sure the next one is not skipped"""
+
+    self.log.error( 'There was an error compiling: {}'.format(cmd) )            # Log error
+    active().passes = scheduler.passes
+    state.pop( 'manifest', None )                                               # Make sure next compile is not skipped
+    state.save()
+    return False
 
   def trackChanges(self, texfile = None, **kwargs): 
     """
@@ -203,50 +669,269 @@ class LaTeX( Acronyms ):
       refFile  : Full path to old, reference file.
 
     Returns:
-      None: but a tracked changes file will be created
+      BuildResult : True if tracked changes file was created and compiled,
+        False otherwise
 
     """
 
     texfile = self._checkTeXFile( texfile )
-    diff = self._latexDiff( **kwargs )
-    if diff:
-      self.compile( texfile = diff, **kwargs)
+    with BuildResult( 'trackChanges', texfile ) as result:
+      diff = self._latexDiff( **kwargs )
+      if diff:
+        with self._building:                                                    # Do not seed from a compile of the root running
+          self._seedBuild( diff )                                               # in another job; its aux and bbl may be half written
+        build = self.compile( texfile = diff, **kwargs )
+        result.extend( build )
+        result.success = build.success
+    return result
+
+  def _seedBuild(self, texfile, merge = True, refresh = False):
+    """
+    Seed the build of a derived document with artifacts of the main build
+
+    A derived document (e.g., the tracked changes file) is the same
+    document under another jobname, so its first pass can start from the
+    main build's aux data and bibliography. The BibTeX fingerprint is
+    shared too, so BibTeX is only run for the derived document if its
+    citations differ from the main document's.
+
+    Arguments:
+      texfile (str) : Path to derived TeX file
+
+    Keyword arguments:
+      merge (bool) : Merge aux files \\@input by the main aux file into the
+        seeded aux file; needed if the derived document is flattened
+      refresh (bool) : Seed even if the derived document has its own aux
+        file, as long as the main aux file is newer. By default, nothing
+        is seeded if the derived document has an aux file.
+
+    Returns:
+      None.
+
+    """
+
+    main = os.path.splitext( self.texfile )[0]
+    job  = os.path.splitext( texfile )[0]
+    if not os.path.isfile( f'{main}.aux' ):
+      return
+    if os.path.isfile( f'{job}.aux' ):
+      if not refresh or os.stat( f'{job}.aux' ).st_mtime_ns >= os.stat( f'{main}.aux' ).st_mtime_ns:
+        return
+
+    self.log.debug( f'Seeding {job}.aux and {job}.bbl from main build' )
+    if merge:
+      mergeAux( f'{main}.aux', f'{job}.aux' )
+    else:
+      shutil.copyfile( f'{main}.aux', f'{job}.aux' )
+    if os.path.isfile( f'{main}.bbl' ):
+      shutil.copyfile( f'{main}.bbl', f'{job}.bbl' )
+      digest = DocState( self.texfile ).get( 'bibtex', None )
+      if digest:
+        state = DocState( texfile )
+        state['bibtex'] = digest
+        state.save()
+
+  def _partialBuild(self, texfile, only):
+    """
+    Set up a build of only the \\include'd files containing given files
+
+    A wrapper TeX file, named after the document with '_partial' appended,
+    sets \\includeonly and inputs the document. Its aux file is seeded
+    from the last full build; the aux files of the chapters not compiled
+    are left from the last full build, so page numbers and references to
+    them remain valid.
+
+    A partial build is not possible, and None is returned, if there is no
+    full build to start from, the list of \\include'd files changed since
+    the last full build, or any of the files is not part of an \\include'd
+    file (e.g., the root document or its preamble).
+
+    Arguments:
+      texfile (str) : Path to root TeX file
+      only (list) : Paths of files that changed
+
+    Keyword arguments:
+      None.
+
+    Returns:
+      str : Path to the wrapper TeX file; None if a full build is needed
+
+    """
+
+    job      = os.path.splitext( texfile )[0]
+    included = chapters( texfile )
+    if not os.path.isfile( f'{job}.aux' ):
+      self.log.info( 'No full build to start from, running full build' )
+      return None
+    if DocState( texfile ).get( 'includes', None ) != list( included ):
+      self.log.info( 'Included files changed since last full build, running full build' )
+      return None
+
+    selected = []
+    for path in map( os.path.abspath, only ):
+      names = [name for name, files in included.items() if path in files]
+      if not names:
+        self.log.info( f'Not part of an included file, running full build: {path}' )
+        return None
+      selected.extend( names )
+    selected = [name for name in included if name in selected]                 # Document order, no duplicates
+
+    partial = '{}_partial.tex'.format( job )
+    text    = '\\includeonly{{{}}}\n\\input{{{}}}\n'.format(
+      ','.join( selected ), os.path.basename( texfile ) )
+    old     = None
+    if os.path.isfile( partial ):
+      with open(partial, 'r') as fid:
+        old = fid.read()
+    if old != text:                                                             # Keep mtime if unchanged
+      with open(partial, 'w') as fid:
+        fid.write( text )
+    self._seedBuild( partial, merge = False, refresh = True )
+    self.log.info( 'Partial build of: {}'.format( ', '.join( selected ) ) )
+    return partial
 
   def exportTo(self, **kwargs):
+    """
+    Export the document to Markdown and/or docx using pandoc
+
+    Text is passed to pandoc over stdin. If both formats are requested,
+    the LaTeX is parsed by pandoc once, into its JSON document tree,
+    and both outputs are written from that tree.
+
+    Arguments:
+      None.
+
+    Keyword arguments:
+      markdown (bool) : Set to create a Markdown file
+      docx (bool) : Set to create a docx file
+
+    Returns:
+      BuildResult : True if all requested files were created, False
+        otherwise; includes timings of the transforms and pandoc runs
+
+    """
+
+    with BuildResult( 'export', self.texfile ) as result:
+      result.success = self._export( **kwargs )
+    return result
+
+  def _export(self, **kwargs):
+    """Export the document; see exportTo()"""
+
     fname, ext = os.path.splitext( self.texfile )																# Get extensionless file path
     text    = removeComments( self._text )																			# Remove comments for
     bibFile = self.getBibFile(text)																							# Get bibliography file name
     docx    = '{}.docx'.format( fname ) if kwargs.get('docx',     False) else None
     md      = '{}.md'.format(   fname ) if kwargs.get('markdown', False) else None
-    if md or docx:
-      md = self._toMarkdown(text=text, outFile=md, bibFile=bibFile)
-      if docx:
-        self._toDOCX(docx, text=md, bibFile=bibFile)
- 
-  def _toDOCX( self, outFile, **kwargs ):
-    self.log.debug('Converting to docx...')
-    text = kwargs.get('text', None)
-    if text is None:
-      text = self._toMarkdown(**kwargs)
+    if not (md or docx):
+      return True
+
+    text, title, authors = self._prepare( text )
+    if md and docx:                                                             # Parse LaTeX once for both outputs
+      self.log.debug('Parsing LaTeX to pandoc document tree...')
+      src, srcfmt = self._convert( text, destfmt = 'json' ), 'json'
+      if src is None: return False
+    else:
+      src, srcfmt = text, 'latex'
+
+    ok = True
+    if md:
+      ok = self._toMarkdown( text=src, srcfmt=srcfmt, outFile=md, bibFile=bibFile,
+                             title=title, authors=authors ) is not None
+    if docx:
+      ok = self._toDOCX( docx, text=src, srcfmt=srcfmt, bibFile=bibFile,
+                         title=title, authors=authors ) and ok
+    return ok
+
+  def _prepare(self, text = None):
+    """
+    Apply the Python transforms needed before conversion with pandoc
+
+    Arguments:
+      None.
+
+    Keyword arguments:
+      text (str) : Text to process; default is text from file with
+        comments removed
+
+    Returns:
+      tuple : Processed text, title, and authors
 
-    fid = tempfile.NamedTemporaryFile( mode='w', suffix='.tex', delete=False )
-    fid.write( text )
-    fid.close()
+    """
+
+    if text is None: text = removeComments( self._text )
+    with stage( 'crossref' ):
+      text    = CROSSREF.process(text)                                          # Number all environments and resolve refs in one pass
+    with stage( 'acronyms' ):
+      text    = self.subAcros(   text ) or text
+    with stage( 'metadata' ):
+      title   = self.getTitle(   text )                                         # Title, authors, and abstract share one index of text
+      authors = self.getAuthors( text )
+      text    = self.insertAbstract(text)
+    return text, title, authors
+
+  def _convert(self, text, outFile = None, **kwargs):
+    """
+    Run pandoc, passing text over stdin
+
+    Arguments:
+      text (str,bytes) : Document to convert
+
+    Keyword arguments:
+      outFile (str) : File to write output to; default is to return it
+      **kwargs : Passed to _pandoc(); srcfmt, destfmt, bibFile, metadata
 
-    tmpFile = fid.name
+    Returns:
+      bytes : Output of pandoc (empty if outFile given); None on error
+
+    """
 
-    kwargs['srcfmt'] = 'markdown'
-    pandoc = self._pandoc(outFile=outFile, **kwargs) 
+    if isinstance(text, str): text = text.encode()
+    cmd = self._pandoc( outFile = outFile, **kwargs )
     try:
-      #p1 = Popen( ['echo', text], stdout=PIPE)
-      #p2 = Popen( pandoc, cwd = os.path.dirname(outFile), stdin=p1.stdout)
-      pandoc.append(tmpFile)
-      p2 = Popen( pandoc, cwd = os.path.dirname(outFile) )
-      p2.communicate()
+      proc = self._call( cmd, cwd = os.path.dirname( self.texfile ), input = text, stage = 'pandoc' )
     except Exception as err:
       self.log.error( err )
-      return False
-    return True
+      return None
+    if proc.returncode != 0:
+      self.log.error( f'Pandoc failed: {cmd}' )
+      return None
+    return proc.output
+
+  def _toDOCX( self, outFile, **kwargs ):
+    """
+    Method to convert to docx format
+
+    Arguments:
+      outFile (str) : Path to output file
+
+    Keyword arguments:
+      text    : Text to convert; default is text from file, processed
+                 with _prepare()
+      srcfmt  : Pandoc format of text; default is 'markdown' if text
+                 is given, 'latex' otherwise
+      bibFile : Bibliography file
+      title   : Document title, if text is not markdown
+      authors : Document authors separated by '; ', if text is
+                 not markdown
+    Returns:
+      bool : True on success, False otherwise
+
+    """
+    self.log.debug('Converting to docx...')
+    text   = kwargs.get('text', None)
+    srcfmt = kwargs.get('srcfmt', 'markdown')
+    title, authors = kwargs.get('title', None), kwargs.get('authors', None)
+    if text is None:
+      text, title, authors = self._prepare()
+      srcfmt = 'latex'
+
+    metadata = []
+    if srcfmt != 'markdown':                                                    # Markdown carries its own title block
+      if title:   metadata.append( ('title', title) )
+      if authors: metadata.extend( [('author', author) for author in authors.split('; ')] )
+    return self._convert( text, outFile = outFile, srcfmt = srcfmt, destfmt = 'docx',
+                          bibFile = kwargs.get('bibFile', None), metadata = metadata ) is not None
 
   def _toMarkdown( self, **kwargs ):
     """
@@ -257,42 +942,29 @@ class LaTeX( Acronyms ):
 
     Keyword arguments:
       text    : Text to process; default is to used text from file
+      srcfmt  : Pandoc format of text; if not 'latex' (the default),
+                 text is not processed and title and authors should
+                 be given
       outFile : Path to output file for saving data; default
                  is to not write data to disk
+      bibFile : Bibliography file
     Returns:
       Returns string containing converted text
 
     """ 
-    fileDir = os.path.dirname( self.texfile );
-    text    = kwargs.get('text', removeComments( self._text ))
-    for env in ENVIRONS:
-      text = env.process(text)
-
-    text     = self.subAcros(   text )
-    text     = self.insertAbstract(text)
-    title    = self.getTitle(   text ) 
-    authors  = self.getAuthors( text )
+    text    = kwargs.get('text', None)
+    srcfmt  = kwargs.get('srcfmt', 'latex')
+    title, authors = kwargs.get('title', None), kwargs.get('authors', None)
+    if srcfmt == 'latex':
+      text, title, authors = self._prepare( text )
     metadata = f'%{title}{os.linesep}%{authors}{os.linesep}{os.linesep}'
 
-    fid = tempfile.NamedTemporaryFile( mode='w', suffix='.tex', delete=False )
-    fid.write( text )
-    fid.close()
-
-    tmpFile = fid.name
-
-    outFile = kwargs.pop('outFile', None)
-    kwargs['destfmt'] = 'markdown'
-    pandoc = self._pandoc(**kwargs)
-    try:
-      pandoc.append( tmpFile )
-      p2 = Popen( pandoc, cwd = fileDir, stdout=PIPE)
-      stdout = p2.stdout.read()
-      p2.communicate()
-      code = p2.returncode
-    except Exception as err:
-      self.log.error( err )
+    stdout = self._convert( text, srcfmt = srcfmt, destfmt = 'markdown',
+                            bibFile = kwargs.get('bibFile', None) )
+    if stdout is None:
       return None
     stdout  = metadata + stdout.decode()
+    outFile = kwargs.get('outFile', None)
     if outFile is not None:
       with open(outFile, 'w') as fid:
         fid.write( stdout )
@@ -302,6 +974,9 @@ class LaTeX( Acronyms ):
     """
     Method for creating tracked changes using the latexdiff CLI
 
+    latexdiff is not run if the old and new texts are identical to those
+    of the previous run and the tracked changes file still exists.
+
     Arguments:
       None.
 
@@ -310,38 +985,44 @@ class LaTeX( Acronyms ):
       refFile  : Full path to old, reference file.
 
     Returns:
-      None: Tracked changes tex file will be created
+      str,bool : Path to tracked changes tex file, False on error
 
     """
     if gitBranch:
-      tmp = LaTeX( self.texfile, gitBranch = gitBranch )
-      fid = tempfile.NamedTemporaryFile( mode='w', suffix='.tex', delete=False )
-      fid.write( tmp._text )
-      fid.close()
-
-      refFile = fid.name
-    elif not refFile:
+      oldText = LaTeX( self.texfile, gitBranch = gitBranch )._text
+    elif refFile:
+      with open(refFile, 'r') as fid:
+        oldText = fid.read()
+    else:
       return False
  
-    self.log.info('Runing latexdiff')
-    diff = '{}_track_changes{}'.format( *os.path.splitext(self.texfile) )
-
-    fid = tempfile.NamedTemporaryFile( mode='w', suffix='.tex', delete=False )
-    fid.write( self._text )
-    fid.close()
-    newFile = fid.name
-    with open(diff, 'w') as fid:
-      #proc = Popen( self.LATEXDIFF + [refFile, self.texfile], stdout = fid )
-      proc = Popen( self.LATEXDIFF + [refFile, newFile], stdout = fid )
-      proc.wait()
+    diff   = '{}_track_changes{}'.format( *os.path.splitext(self.texfile) )
+    state  = DocState( diff )                                                   # Not state of root; a compile may be saving it
+    digest = hashText( os.linesep.join( self.LATEXDIFF + [oldText, '\0', self._text] ) )
+    if digest == state.get('trackChanges', None) and os.path.isfile( diff ):
+      self.log.info('Texts unchanged since last latexdiff, reusing: {}'.format(diff))
+      return diff
 
-    if gitBranch:
-      self.log.debug('Removing temporary file: {}'.format(refFile) )
-      os.remove( refFile )
-      os.remove( newFile )
+    self.log.info('Runing latexdiff')
+    tmpFiles = []
+    try:
+      for text in (oldText, self._text):
+        with tempfile.NamedTemporaryFile( mode='w', suffix='.tex', delete=False ) as fid:
+          tmpFiles.append( fid.name )
+          fid.write( text )
+      with open(diff, 'w') as fid:
+        proc = self._call( self.LATEXDIFF + tmpFiles, stdout = fid, stage = 'latexdiff' )
+    finally:
+      for tmpFile in tmpFiles:
+        self.log.debug('Removing temporary file: {}'.format(tmpFile) )
+        os.remove( tmpFile )
 
     if proc.returncode == 0:
+      state['trackChanges'] = digest
+      state.save()
       return diff
     else:
       self.log.error('There was an error running latexdiff')
+      state.pop('trackChanges', None)
+      state.save()
       return False
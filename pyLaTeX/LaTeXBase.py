@@ -1,16 +1,21 @@
 import logging
 import os, re
 
-from . import VERSIONS
-from .utils import recursiveRegex, replaceInputs, removeComments, gitShow
+from .docindex import DocIndex
+from .texlive import LATEST, getVersions
+from .utils import expandInputs, removeComments, gitShow
 
 TEXROOT_PATTERN = re.compile( r"\!TEX root\s*=\s*(.*)" )
 
 class LaTeXBase( object ):
-  def __init__(self, texfile, gitBranch=None, texlive='Latest'):
-    self._texlive  = 'Latest'
+  PANDOC = ['pandoc']
+
+  def __init__(self, texfile, gitBranch=None, texlive=LATEST):
+    self._texlive  = LATEST
     self._texfile  = None
     self._text     = None
+    self._index    = None
+    self.sourceMap = None                                                       # Maps offsets in _text to (file, line)
 
     self.log       = logging.getLogger(__name__)
     self.gitBranch = gitBranch
@@ -35,24 +40,52 @@ class LaTeXBase( object ):
     return self._texlive
   @texlive.setter
   def texlive(self, val):
-    if isinstance(val, str) and val in VERSIONS:
+    if isinstance(val, str):                                                    # Validated when texpath first needed
       self._texlive = val
     elif val is not None:
       self.log.error( f'Not a valid texlive version: {val}' )
 
   @property
   def texpath(self):
-    return VERSIONS[ self._texlive ] 
+    versions = getVersions()
+    if self._texlive not in versions:
+      self.log.error( f'Not a valid texlive version: {self._texlive}' )
+      self._texlive = LATEST
+    return versions[ self._texlive ] 
+
+  def docIndex(self, text = None):
+    """
+    Get index of command occurrences in text
+
+    The index is built once and reused until different text is requested,
+    so several metadata lookups on the same text share one scan.
+
+    Arguments:
+      None.
+
+    Keyword arguments:
+      text (str) : Text to index; default is text read in from TeX file
+
+    Returns:
+      DocIndex
+
+    """
+
+    if text is None: text = self._text
+    if self._index is None or (self._index.text is not text and self._index.text != text):
+      self._index = DocIndex( text )
+    return self._index
+
   def loadFile(self, texfile):
     self.texfile = texfile
     text = self._findRoot( )
-    self._text = replaceInputs( self.texfile, text, self.gitBranch )
+    self._text, self.sourceMap = expandInputs( self.texfile, text, self.gitBranch )
 
     return True
 
   def insertAbstract(self, text = None):
     if text is None: text = self._text
-    res = recursiveRegex(r'\\abstract', ('{','}',)).findall( text )
+    res = self.docIndex( text ).arguments( 'abstract' )
     if (len(res) == 1):
       res  = res[0][1:-1]
       sub  = r'\\begin{document}'
@@ -63,7 +96,7 @@ class LaTeXBase( object ):
     if text is None: 
       text = self._text
       #text = removeComments( self._text )
-    res = recursiveRegex(r'\\title', ('{','}',)).findall( text )
+    res = self.docIndex( text ).arguments( 'title' )
     if (len(res) == 1):
       return res[0][1:-1]
     return None
@@ -72,7 +105,7 @@ class LaTeXBase( object ):
     if text is None: 
       text = self._text
       #text = removeComments(self._text)
-    res = recursiveRegex(r'\\authors', ('{','}',)).findall( text )
+    res = self.docIndex( text ).arguments( 'authors' )
     if (len(res) == 1):
       res = re.sub( r'\\\w+{[^}]+}', '', res[0][1:-1] )
       return '; '.join( [i.strip().rstrip() for i in res.split('and')] )
@@ -83,7 +116,7 @@ class LaTeXBase( object ):
       text = self._text
       #text = removeComments(self._text)
     for tmp in ['bibliography', 'bibFile']:
-      res = recursiveRegex( r"\\"+tmp, ("{", "}",) ).findall(text)
+      res = self.docIndex( text ).arguments( tmp )
       if len(res) == 1:
         bibFile = os.path.expandvars( res[0][1:-1] )                                # Convert bib from list to string
         if not bibFile.endswith('.bib'): bibFile += '.bib';                         # If the file path does NOT end wi
@@ -176,10 +209,12 @@ class LaTeXBase( object ):
         fid.write( text )
 
   def _pandoc(self, outFile=None, **kwargs):
-    cmd     = ['pandoc', '--from', kwargs.get('srcfmt',  'latex'), 
-                         '--to',   kwargs.get('destfmt', 'docx')]
+    cmd     = self.PANDOC + ['--from', kwargs.get('srcfmt',  'latex'), 
+                             '--to',   kwargs.get('destfmt', 'docx')]
     if kwargs.get('bibFile', None):
       cmd += ['--bibliography', kwargs.get('bibFile')]
+    for key, val in kwargs.get('metadata', None) or []:                         # Document metadata, e.g., title
+      cmd += ['--metadata', f'{key}={val}']
     cmd.append( '-o' )
     if outFile:
       cmd.append( outFile )
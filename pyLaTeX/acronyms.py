@@ -1,33 +1,27 @@
 import logging
-import os
-import regex as re
+import os, re
+import json
+from collections import OrderedDict
+from threading import Lock
 
 from .LaTeXBase import LaTeXBase
-from .utils import recursiveRegex
+from .cache import cacheDir, hashText
+from .utils import Balanced
 
 """
-The ACRODEF regex pattern was found at the following link:
-https://www.regular-expressions.info/refrecurse.html
-
-In words:
-    Recurusion of a capturing group
-    Find the 'DeclareAcronym' string (case-sensitive)
-    Then use the basic pattern b(?>m|(?R))e where b is
-    matching construct, m is what can occur in middle, and
-    e is ending.
-    In this case, m is[^{}], i.e., not one of those characters,
-    or the matching construct. To get around the case where b
-    is all the text preceding the parenthesis, we replace (?R)
-    with (?1), a reference to the first caputure group. This
-    is all placed inside a capture group. 
-
-    Note that this capture group will contain the opening and
-    closing {}, so best to do match[1:-1] to get rid of them
+The ACRODEF pattern finds the 'DeclareAcronym' string (case-sensitive)
+followed by the acronym name in {} and the balanced {} group of
+definitions; findall() returns (name, definitions) tuples.
+
+Note that the definitions will contain the opening and
+closing {}, so best to do match[1:-1] to get rid of them
 """
 
-ACRODEF = recursiveRegex( r'\\DeclareAcronym{([^}]*)}', ('{', '}',), group=2 )
+ACRODEF = Balanced( r'\\DeclareAcronym{([^}]*)}' )
+# Acronym commands; those with 'unused' and 'used' formats mark the acronym
+# as used, the others always use the same format
 ACSUBS  = {
-        r"\\ac{([^}]+)}" : {
+        'ac' : {
             'unused' : {
                 'keys'   : ('long', 'short',),
                 'format' : '{}  ({})'},
@@ -35,7 +29,7 @@ ACSUBS  = {
                 'keys'   : ('short',),
                 'format' :'{}'},
             },
-        r"\\acp{([^}]+)}" : {
+        'acp' : {
             'unused' : {
                 'keys'   : ('long', 'short',),
                 'format' : '{}s ({}s)'},
@@ -43,13 +37,162 @@ ACSUBS  = {
                 'keys'   : ('short',),
                 'format' : '{}s'},
             },
-        r"\\acs{([^}]+)}" : {
+        'acf' : {
+            'unused' : {
+                'keys'   : ('long', 'short',),
+                'format' : '{} ({})'},
+            'used'   : {
+                'keys'   : ('long', 'short',),
+                'format' : '{} ({})'},
+            },
+        'acfp' : {
+            'unused' : {
+                'keys'   : ('long', 'short',),
+                'format' : '{}s ({}s)'},
+            'used'   : {
+                'keys'   : ('long', 'short',),
+                'format' : '{}s ({}s)'},
+            },
+        'acs' : {
             'keys'   : ('short',),
             'format' : '{}'},
-        r"\\acl{([^}]+)}" : {
+        'acsp' : {
+            'keys'   : ('short',),
+            'format' : '{}s'},
+        'acl' : {
             'keys'   : ('long',),
             'format' : '{}'},
+        'aclp' : {
+            'keys'   : ('long',),
+            'format' : '{}s'},
          }
+ACSUBS.update( {key.capitalize() : val for key, val in ACSUBS.items()} )        # \Ac, \Acp, ... capitalize the first letter
+
+RESET   = r'\\(acresetall\b|acreset\*?{[^}]*})'                                 # \acresetall or \acreset{...}
+ACCMD   = re.compile(                                                           # Any acronym or reset command
+  r'(?<![^\n])[ \t]*(?P<line>' + RESET + r')[ \t]*(?:\r?\n|$)|'                  # Reset on its own line; line is removed
+  r'(?P<reset>' + RESET + r')|'
+  r'\\(?P<cmd>' + '|'.join( sorted(ACSUBS, key=len, reverse=True) ) + r')\*?{(?P<ac>[^}]+)}'
+)
+MAXDEPTH = 10                                                                   # Maximum nesting of acronyms in definitions
+
+CACHESIZE = 32                                                                  # Number of glossaries kept in memory
+DISKSIZE  = 4                                                                   # Number of versions kept on disk per path
+_CACHE    = OrderedDict()                                                       # In-process LRU cache of parsed glossaries
+_LOCK     = Lock()
+
+def parseAcronyms( text ):
+  """
+  Parse all \\DeclareAcronym definitions in text
+
+  Arguments:
+    text (str) : Text containing acronym definitions
+
+  Keyword arguments:
+    None.
+
+  Returns:
+    dict : Keys are acronym names, values are dicts of definition keys
+      (short, long, ...) and values
+
+  """
+
+  acronyms = {}
+  for acro, info in ACRODEF.findall( text ):
+    acronyms[acro] = {}
+    for keyVal in info[1:-1].replace(',','\n').splitlines():
+      try:
+        key, val = keyVal.split('=')
+      except:
+        pass
+      else:
+        acronyms[acro].update( {key.strip() : val.strip()} )
+  return acronyms
+
+def _memory( key, value = None ):
+  """Get, or set if value given, entry of in-process LRU cache"""
+
+  with _LOCK:
+    if value is None:
+      if key in _CACHE:
+        _CACHE.move_to_end( key )
+      return _CACHE.get( key, None )
+    _CACHE[key] = value
+    while len(_CACHE) > CACHESIZE:
+      _CACHE.popitem( last = False )
+    return value
+
+def loadAcronyms( path, text = None ):
+  """
+  Get parsed acronym definitions through in-process and on-disk caches
+
+  If only path is given, the file is read and parsed. An unchanged file
+  (same size and modification time) costs one stat call; a touched file
+  with the same content costs one read and hash. If text is given, e.g.,
+  the full text of a document, it is parsed instead and cached under
+  path and the hash of text. The on-disk cache of a path keeps the last
+  DISKSIZE versions by content hash, so parsing another version of the
+  same path, e.g., from a git revision, does not evict the current one.
+
+  Arguments:
+    path (str) : Path to acronym file, or document text came from
+
+  Keyword arguments:
+    text (str) : Text to parse instead of contents of path
+
+  Returns:
+    dict : Output from parseAcronyms(); shared between callers, so must
+      not be modified
+
+  """
+
+  log  = logging.getLogger(__name__)
+  path = os.path.abspath( path )
+  stat = None
+  if text is None:
+    stat = os.stat( path )
+    stat = [stat.st_size, stat.st_mtime_ns]
+    key  = (path, *stat)
+  else:
+    key  = (path, hashText(text))
+  acronyms = _memory( key )
+  if acronyms is not None:
+    return acronyms
+
+  diskFile = os.path.join( cacheDir('acronyms'), hashText(path) + '.json' )
+  try:
+    with open(diskFile, 'r') as fid:
+      data = json.load( fid )
+  except Exception:
+    data = {}
+
+  entries = data.get('entries', {})                                             # Content hash -> acronyms, oldest first
+  if stat is not None and data.get('stat') == stat and data.get('hash') in entries: # File not touched since cached
+    return _memory( key, entries[data['hash']] )
+
+  if text is None:
+    with open(path, 'r') as fid:
+      text = fid.read()
+  digest   = hashText( text )
+  acronyms = entries.pop( digest, None )
+  if acronyms is None:                                                          # Content not cached
+    log.debug( f'Parsing acronym definitions: {path}' )
+    acronyms = parseAcronyms( text )
+  entries[digest] = acronyms
+  while len(entries) > DISKSIZE:
+    entries.pop( next(iter(entries)) )
+
+  if stat is None:                                                              # Keep stat of file version, if any
+    stat, digest = data.get('stat'), data.get('hash')
+  data = {'stat' : stat, 'hash' : digest, 'entries' : entries}
+  try:
+    tmp = f'{diskFile}.{os.getpid()}'
+    with open(tmp, 'w') as fid:
+      json.dump( data, fid )
+    os.replace( tmp, diskFile )
+  except Exception as err:
+    log.debug( f'Failed to write acronym cache: {err}' )
+  return _memory( key, acronyms )
 
 class Acronyms( LaTeXBase ):
   def __init__(self, *args, **kwargs):
@@ -71,7 +214,11 @@ class Acronyms( LaTeXBase ):
     Substitute all acronym calls in text
 
     All (well, most) acronym calls in text will be subsitituded
-    for their full (or short) version.
+    for their full (or short) version. Text is scanned once, left to
+    right, starting after the line containing \\begin{document}.
+    Whether an acronym has been used is tracked per call, so the
+    parsed acronyms are not modified and repeated calls give the same
+    result.
 
     Arguments:
       None.
@@ -87,96 +234,76 @@ class Acronyms( LaTeXBase ):
     """
 
     if self.acro is None: return None                                           # If the acro attribute is None, just return
-    if text is None:
-      lines = self._text.splitlines(True)
-    else:
-      lines = text.splitlines(True)
-
-    document = False                                                            # Check for document actually started; i.e., past preamble
-    for i, line in enumerate(lines):                                            # Iterate over all lines
-      if not document:                                                          # If document variable is False
-        if 'begin{document}' in line:					        # If check string in line
-          document = True                                                       # Set document to True
-        else:                                                                   # Else
-          continue                                                              # Go to next line
-      elif '\\acreset' in line:                                                 # If acreset is in line; this handles specific resets as well as the acresetall command
-        tmp = re.search( r"\\acreset{([^}]+)}", line )				# Search for first instance of specific resets
-        if tmp:                                                                 # If any found
-          for ac in tmp.groups()[0].split(','):					# Iterate over all acronyms to reset
-            self.acro[ac]['used'] = 0                                           # Reset usage state
-        else:                                                                   # Else, assume resetting all
-          for ac in self.acro:					                # Iterate over all defined acronyms
-            self.acro[ac]['used'] = 0                                           # Set used state to zero
-        lines[i] = ''                                                           # Remove the command from the line
-      else:
-        lines[i] = self._lineSub( line )
-    text = ''.join(lines)
-    return text
+    if text is None: text = self._text
+
+    start = text.find( 'begin{document}' )                                      # Preamble, and line with begin{document}, untouched
+    if start < 0: return text
+    start = text.find( '\n', start ) + 1 or len(text)
+    return text[:start] + self._expand( text[start:], set() )
 
-  def _lineSub(self, line):
+  def _expand(self, text, used, depth = 0):
     """
-    Substitute all acro commands in a given line
+    Substitute all acro commands in text in one pass
 
-    The various regex subsitition keys in the ACSUBS dict are tested
-    on the input line. As any one subsitition may, itself, include an
-    acronym definitions, a main while loop is used to check for the
-    occurence of any of the regex patterns in the line. While any
-    patterns exists, will keep rechecking the line.
+    Replacement text may itself contain acronym commands (e.g., a long
+    form that uses another acronym); these are expanded recursively,
+    sharing the usage state, up to MAXDEPTH levels.
 
     Arguments:
-      line (str) : Line to replace acronym commands in
+      text (str) : Text to replace acronym commands in
+      used (set) : Acronyms already used; updated in place
 
     Keyword arguments:
-      None.
+      depth (int) : Current nesting depth
 
     Returns:
-      str : Line with acronym commands replaced
+      str : Text with acronym commands replaced
 
     """
 
-    ff = '|'.join( ACSUBS.keys() )                                              # Regex pattern that looks for all the various subsitutions
-    while re.search( ff, line ):
-      for acReg, acFMT in ACSUBS.items():                                       # Iterate over all possible substitution types
-        tmp = re.search( acReg, line )						# Search for first instance of substitution type
-        while tmp is not None:                                                  # While there is a substitution candidate found
-          ac = tmp.groups()[0]						        # Get text within the {}
-          if 'used' not in acFMT:                                               # If 'used' not in format dictionary
-            info = acFMT                                                        # Set info to acFMT
-          else:                                                                 # Else, more complex 
-            self.acro[ ac ]['used'] += 1					# Increment the acronym use counter by one (1)
-            key  = 'unused' if self.acro[ ac ]['used'] == 1 else 'used'         # If this is the first time acronym is used, set key to unused
-            info = acFMT[key]                                                   # Set info to sub-dictionary of acFMT
-
-          vals = [ self.acro[ac].get(k, '') for k in info['keys'] ]             # Get all acronym information for replacing call 
-          sub  = info['format'].format( *vals )                                 # Generate replacement string
-          line = re.sub( acReg, lambda _: sub, line, count=1)                   # Replace first instance in string; return of lambda function is treated as literal string
-          tmp  = re.search(acReg, line)					        # Search for another substitution candidate
-    return line
+    def sub( match ):
+      reset = match.group('line') or match.group('reset')
+      if reset:
+        if reset.endswith('}'):                                                 # Reset specific acronyms
+          keys = reset[ reset.index('{')+1:-1 ].split(',')
+          used.difference_update( [key.strip() for key in keys] )
+        else:                                                                   # Else, assume resetting all
+          used.clear()
+        return ''
+
+      cmd, ac = match.group('cmd', 'ac')
+      if ac not in self.acro:
+        self.log.warning( f'Acronym not defined: {ac}' )
+        return match.group()
+
+      acFMT = ACSUBS[cmd]
+      if 'used' not in acFMT:                                                   # If 'used' not in format dictionary
+        info = acFMT                                                            # Set info to acFMT
+      else:                                                                     # Else, more complex
+        info = acFMT['used' if ac in used else 'unused']                        # First use gets the unused format
+        used.add( ac )
+
+      vals = [ self.acro[ac].get(k, '') for k in info['keys'] ]                 # Get all acronym information for replacing call
+      sub  = info['format'].format( *vals )                                     # Generate replacement string
+      if depth < MAXDEPTH and '\\' in sub:                                      # Definition may contain acronyms
+        sub = self._expand( sub, used, depth + 1 )
+      if cmd[0].isupper():
+        sub = sub[:1].upper() + sub[1:]
+      return sub
+
+    return ACCMD.sub( sub, text )
 
   #########################################
   def _parseAcros(self, acroFile=None):
     if acroFile is not None:
       self.log.debug(f'Using acronym definitions from: {acroFile}')
-      with open(acroFile, 'r') as fid:
-        text = fid.read()
-    else:
-      acro = False
-      for line in self._text.splitlines():
-        if 'usepackage' and 'acro' in line:
-          acro = True;
-          break;
-      if not acro:
-        return None;
-      else:
-        text = self._text
-    acronyms = {}
-    for acro, info in ACRODEF.findall( text ):
-      acronyms[acro] = {'used' : 0}
-      for keyVal in info[1:-1].replace(',','\n').splitlines():
-        try:
-          key, val = keyVal.split('=')
-        except:
-          pass
-        else:
-          acronyms[acro].update( {key.strip() : val.strip()} )
-    return acronyms
+      return loadAcronyms( acroFile )
+
+    acro = False
+    for line in self._text.splitlines():
+      if 'usepackage' and 'acro' in line:
+        acro = True;
+        break;
+    if not acro:
+      return None;
+    return loadAcronyms( self.texfile, self._text )
@@ -1,31 +1,211 @@
 import logging
 import os, sys, time, signal
-from threading import Thread, Event, Lock
+from threading import Thread, Event, Condition, Lock
 from queue import Queue
+from concurrent.futures import ThreadPoolExecutor
 from watchdog.events import FileSystemEventHandler
 
 from .LaTeX import LaTeX
+from .cache import hashFile
+from .depindex import DepIndex, GRAPHEXT, ARTIFACTS
+from .metrics import writeJSONLines, writePrometheus
+from .recorder import parseRecorder
+
+DELAY   = 0.5                                                                   # Seconds of quiet before a document is built
+MAXWAIT = 5.0                                                                   # Maximum seconds a build is postponed by new events
+
+SOURCES = ('.tex', '.bib', '.bst', '.sty', '.cls') + GRAPHEXT                  # Files that may be used by a document
 
 RUNNING = Event()
 RUNNING.set()
 def sigHandler(*args, **kwargs):
   RUNNING.clear()
 
+class ChangeFilter( object ):
+  """
+  Decide which file events are real changes to document sources
+
+  The size, modification time, and content hash of each source seen are
+  kept. An event for a file whose content is unchanged, e.g., an editor
+  autosave, is not a change. Neither are events for files written by the
+  builds themselves: files with the pyLaTeX ARTIFACTS suffixes and the
+  outputs listed in the recorder (.fls) files of compiled documents.
+
+  """
+
+  def __init__(self):
+    self.hashes  = {}                                                           # Path -> (size, mtime, hash) of source
+    self.outputs = set()                                                        # Files written by the engine
+    self._lock   = Lock()
+
+  def isArtifact(self, path):
+    """Check if a file is written by a build"""
+
+    return path.endswith( ARTIFACTS ) or path in self.outputs
+
+  def addOutputs(self, texFile):
+    """Record the outputs of a compile of texFile as artifacts"""
+
+    outputs = parseRecorder( '{}.fls'.format( os.path.splitext(texFile)[0] ) )[1]
+    with self._lock:
+      self.outputs.update( outputs )
+
+  def seed(self, *paths):
+    """Record current contents of files, so the first event is compared"""
+
+    for path in paths:
+      self.changed( path )
+
+  def changed(self, path):
+    """
+    Check if the content of a source file has changed since last seen
+
+    Arguments:
+      path (str) : Path to file
+
+    Keyword arguments:
+      None.
+
+    Returns:
+      bool : True if the file is new, deleted, or its content changed;
+        False if it is unchanged or written by a build
+
+    """
+
+    path = os.path.abspath( path )
+    with self._lock:
+      if self.isArtifact( path ):
+        return False
+      try:
+        stat = os.stat( path )
+      except OSError:                                                           # Deleted
+        return self.hashes.pop( path, None ) is not None
+      key = (stat.st_size, stat.st_mtime_ns)
+      old = self.hashes.get( path, None )
+      if old is not None and old[:2] == key:
+        return False
+      digest = hashFile( path )
+      self.hashes[path] = key + (digest,)
+      return old is None or old[2] != digest
+
+class CompileScheduler( object ):
+  """
+  Debounce, coalesce, and run builds of several documents
+
+  Each call to submit() (re)starts a short quiet period for the document;
+  the document is built once no new request for it has arrived for delay
+  seconds, or maxWait seconds after the first request of a burst, so a
+  burst of saves results in one build. A document is never built twice at
+  the same time: a request that arrives while the document is building
+  is held and run after the build finishes, so the last save is always
+  built. Different documents build concurrently in a bounded pool.
+
+  """
+
+  def __init__(self, build, workers = None, delay = DELAY, maxWait = MAXWAIT):
+    """
+    Arguments:
+      build (callable) : Called with the path of the document to build and
+        the set of changed files submitted for it
+
+    Keyword arguments:
+      workers (int) : Maximum number of concurrent builds; default is
+        number of CPUs
+      delay (float) : Seconds of quiet before a document is built
+      maxWait (float) : Maximum seconds a build is postponed by new requests
+
+    """
+
+    self.__log     = logging.getLogger(__name__)
+    self.build     = build
+    self.delay     = delay
+    self.maxWait   = maxWait
+    self.pool      = ThreadPoolExecutor( max_workers = workers or os.cpu_count() or 1 )
+    self._cond     = Condition()
+    self._due      = {}                                                         # Document -> time it should be built
+    self._first    = {}                                                         # Document -> time of first request of burst
+    self._changed  = {}                                                         # Document -> files changed since its last build
+    self._running  = set()                                                      # Documents currently building
+    self._closed   = False
+    self._thread   = Thread( target = self._dispatch, daemon = True )
+    self._thread.start()
+
+  def submit(self, root, path = None):
+    """Request a build of a document, optionally noting the file that changed"""
+
+    with self._cond:
+      if self._closed: return
+      changed = self._changed.setdefault( root, set() )
+      if path: changed.add( path )
+      now   = time.monotonic()
+      first = self._first.setdefault( root, now )
+      self._due[root] = min( now + self.delay, first + self.maxWait )
+      self._cond.notify()
+
+  def shutdown(self, wait = True):
+    """Stop scheduling builds; pending requests are dropped"""
+
+    with self._cond:
+      self._closed = True
+      self._cond.notify()
+    self._thread.join()
+    self.pool.shutdown( wait = wait )
+
+  def _dispatch(self):
+    """Start builds of documents whose quiet period has passed"""
+
+    with self._cond:
+      while not self._closed:
+        now  = time.monotonic()
+        wait = None
+        for root, due in list( self._due.items() ):
+          if root in self._running:                                             # Held until current build finishes
+            continue
+          if due > now:
+            wait = due - now if wait is None else min( wait, due - now )
+            continue
+          del self._due[root], self._first[root]
+          self._running.add( root )
+          self.pool.submit( self._build, root, self._changed.pop( root, set() ) )
+        self._cond.wait( wait )
+
+  def _build(self, root, changed):
+    """Run a build, then release the document for its next build"""
+
+    try:
+      self.build( root, changed )
+    except Exception:
+      self.__log.exception( f'Build failed: {root}' )
+    finally:
+      with self._cond:
+        self._running.discard( root )
+        self._cond.notify()                                                     # Requests made during build are now due
+
 class TeXHandler( FileSystemEventHandler ):
-  def __init__(self, **kwargs):
+  def __init__(self, indir = os.curdir, jobs = None, delay = DELAY, partial = False,
+               metricsJSON = None, metricsProm = None, **kwargs):
     super().__init__()
     signal.signal( signal.SIGINT,  sigHandler )
     signal.signal( signal.SIGTERM, sigHandler )
     self.__log       = logging.getLogger(__name__)
     self.kwargs      = kwargs
+    self.partial     = partial
+    self.metricsJSON = metricsJSON                                              # Files to export build results to
+    self.metricsProm = metricsProm
+    self.results     = {}                                                       # Document -> last BuildResult
+    self.resultsLock = Lock()
+    self.index       = DepIndex( indir )
+    self.changes     = ChangeFilter()
+    for root in list( self.index.deps ):
+      self.changes.addOutputs( root )
+    self.changes.seed( *self.index.users )
     self.queue       = Queue()
-    self.compileLock = Lock()
-    self.compiling   = Event()
+    self.scheduler   = CompileScheduler( self.__compile, workers = jobs, delay = delay )
     self.thread      = Thread(target=self.__run)
     self.thread.start()
 
   def isTeX(self, filePath):
-    return filePath.endswith('tex')
+    return filePath.lower().endswith( SOURCES )
 
   def isSwap(self, filePath):
     if sys.platform == 'linux':
@@ -35,29 +215,43 @@ class TeXHandler( FileSystemEventHandler ):
   def swapToFile(self, filePath):
     fileDir, fileName = os.path.split( filePath )
     fileName, fileExt = os.path.splitext( fileName )
-    return os.path.join( fileDir, fileName[1:] ) 
+    return os.path.join( fileDir, fileName[1:] )
 
   def on_modified(self, event):
     if not event.is_directory:
       self.__log.debug( event )
       self.queue.put( event.src_path )
 
+  def on_created(self, event):
+    self.on_modified( event )
+
+  def on_moved(self, event):                                                    # Editors that save by renaming a temporary file
+    if not event.is_directory:
+      self.__log.debug( event )
+      self.queue.put( event.dest_path )
+
   def join(self, **kwargs):
     self.thread.join(**kwargs)
 
-  def __compile(self, texFile):
-    with self.compileLock:
-      if self.compiling.is_set():
-        self.__log.debug("Already compiling, have to wait")
-        return
-      else:
-        self.compiling.set()
+  def __compile(self, texFile, changed):
+    kwargs = dict( self.kwargs, only = sorted(changed) if self.partial else None )
+    result = LaTeX( texFile, texlive = self.kwargs.get('texlive', None) ).compile( **kwargs )
+    self.__export( result )
+    self.changes.addOutputs( texFile )
+    self.changes.addOutputs( '{}_partial.tex'.format( os.path.splitext(texFile)[0] ) )
+    self.index.addRoot( texFile )                                               # Pick up files recorded by the engine
+
+  def __export(self, result):
+    """Write build result to the metrics files, if any"""
 
-    l = LaTeX(texFile).compile( **self.kwargs )
-    time.sleep(0.5)
-    self.compiling.clear()
+    with self.resultsLock:
+      self.results[ result.texfile ] = result
+      if self.metricsJSON:
+        writeJSONLines( self.metricsJSON, result )
+      if self.metricsProm:
+        writePrometheus( self.metricsProm, *self.results.values() )
 
-  def __run(self): 
+  def __run(self):
     self.__log.debug('Compile thread started')
     while RUNNING.is_set():
       try:
@@ -67,8 +261,16 @@ class TeXHandler( FileSystemEventHandler ):
 
       if self.isSwap( filePath ):
         filePath = self.swapToFile( filePath )
-      if self.isTeX( filePath ):
-        Thread( target = self.__compile, args=(filePath,) ).start()
+      if not self.isTeX( filePath ):
+        continue
+      if not self.changes.changed( filePath ):
+        self.__log.debug( f'Content unchanged or build output, ignoring: {filePath}' )
+        continue
+      roots = self.index.update( filePath )
+      if not roots:
+        self.__log.debug( f'Not used by any root document: {filePath}' )
+      for root in roots:
+        self.scheduler.submit( root, filePath )
 
     self.__log.debug('Compile thread stopped')
-
+    self.scheduler.shutdown()
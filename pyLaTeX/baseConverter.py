@@ -7,7 +7,6 @@ docEnd   = '\\end{document}'
 sections = { re.compile( r'\\section{(.+)}' ) : 1 }
 subs     = ( ('\&', '&'), )
 
-from docx import Document
 class baseConverter( object ):
   def __init__(self, TeX_file):
     super().__init__();
@@ -16,6 +15,7 @@ class baseConverter( object ):
     self.docx      = None
   ##############################################################################
   def convert(self):
+    from docx import Document                                                   # Imported on first use; slow to import
     self.docx   = Document();
     with open( self.TeX_file, 'r' ) as fid:
       data = fid.read();
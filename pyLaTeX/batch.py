@@ -0,0 +1,185 @@
+import logging
+import os, sys, time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+
+from .depindex import findRoots
+
+def _init( level ):
+  """Set up logging in a worker process"""
+
+  from . import log
+  log.handlers[0].setLevel( level )
+
+def _build( texfile, texlive, compileKW, exportKW ):
+  """
+  Compile, and optionally export, one document in a worker process
+
+  Arguments:
+    texfile (str) : Path to root TeX file
+    texlive (str) : TeX Live version to use; None for latest
+    compileKW (dict) : Keywords for LaTeX.compile()
+    exportKW (dict) : Keywords for LaTeX.exportTo(); None to not export
+
+  Keyword arguments:
+    None.
+
+  Returns:
+    dict : Report with keys name, success, seconds, error, and results
+      (BuildResults of the jobs run)
+
+  """
+
+  from .LaTeX import LaTeX                                                      # Imported in worker, so parent stays light
+
+  log     = logging.getLogger(__name__)
+  t0      = time.perf_counter()
+  results = []
+  error   = None
+  try:
+    latex = LaTeX( texfile, texlive = texlive )
+    results.append( latex.compile( **compileKW ) )
+    if results[-1] and exportKW:
+      results.append( latex.exportTo( **exportKW ) )
+  except Exception as err:
+    log.exception( f'Build failed: {texfile}' )
+    error = f'{type(err).__name__}: {err}'
+  return {'name'    : texfile,
+          'success' : error is None and len(results) > 0 and all(results),
+          'seconds' : time.perf_counter() - t0,
+          'error'   : error,
+          'results' : results}
+
+def runBatch( paths, workers = None, failFast = False, texlive = None, exportKW = None, **compileKW ):
+  """
+  Compile many documents in parallel
+
+  Each document is built in its own worker process, which is replaced
+  after every document, so caches and other state of one build never leak
+  into another, and an exception only fails its own document. Before
+  Python 3.11, which lacks max_tasks_per_child, every document gets its
+  own single-process pool to the same effect. If a worker
+  dies (e.g., is killed), the process pool is restarted for the remaining
+  documents; builds that were running at the time are reported as failed.
+  Up to one document per CPU is built at once.
+
+  Arguments:
+    paths (list) : Root TeX files and/or directories; directories are
+      searched for root documents with depindex.findRoots(), so files that
+      declare a '!TEX root' other than themselves are skipped
+
+  Keyword arguments:
+    workers (int) : Maximum number of documents to build at once; default
+      is number of CPUs
+    failFast (bool) : If set, stop starting new builds after the first
+      failure; builds already running are finished
+    texlive (str) : TeX Live version to use; default is latest
+    exportKW (dict) : If given, export each successfully compiled document
+      with LaTeX.exportTo(**exportKW)
+    **compileKW : Passed to LaTeX.compile()
+
+  Returns:
+    list : Report dicts, sorted by document, with keys name, success,
+      seconds, error, and results. Documents not built because of failFast
+      have success None.
+
+  """
+
+  log   = logging.getLogger(__name__)
+  files = []
+  for path in paths:
+    if os.path.isdir( path ):
+      files.extend( findRoots( path ) )
+    else:
+      files.append( os.path.abspath( path ) )
+  files = sorted( set(files) )
+  log.info( f'Building {len(files)} document(s)' )
+
+  workers = workers or os.cpu_count() or 1
+  single  = sys.version_info < (3, 11)                                          # No max_tasks_per_child; one pool per document
+  pool    = dict( max_workers = 1 if single else workers,
+                  initializer = _init, initargs = (logging.getLogger('pyLaTeX').handlers[0].level,) )
+  if not single:
+    pool['max_tasks_per_child'] = 1                                             # Fresh process for every document
+
+  report   = {}
+  queue    = iter( files )
+  running  = {}                                                                 # Future -> (path of document, executor)
+  stop     = False
+  executor = None
+
+  def submit( path ):
+    """Start build of a document, restarting the pool if a worker died"""
+
+    nonlocal executor
+    if executor is None or single:
+      executor = ProcessPoolExecutor( **pool )
+    try:
+      future = executor.submit( _build, path, texlive, compileKW, exportKW )
+    except BrokenProcessPool:                                                   # A worker died; builds running with it failed
+      executor.shutdown( wait = False )
+      executor = ProcessPoolExecutor( **pool )
+      future   = executor.submit( _build, path, texlive, compileKW, exportKW )
+    running[future] = (path, executor)
+
+  try:
+    while True:
+      while not stop and len(running) < workers:                                # Submit only what can run now, so failFast
+        path = next( queue, None )                                              # leaves the rest unstarted
+        if path is None: break
+        submit( path )
+      if not running:
+        break
+      done, _ = wait( running, return_when = FIRST_COMPLETED )
+      for future in done:
+        path, owner = running.pop( future )
+        if single:                                                              # Its process has done its one build
+          owner.shutdown()
+        try:
+          res = future.result()
+        except BrokenProcessPool as err:                                        # Worker died, e.g., killed by a signal
+          res = {'name' : path, 'success' : False, 'seconds' : None, 'error' : f'Worker process died: {err}', 'results' : []}
+        except Exception as err:
+          res = {'name' : path, 'success' : False, 'seconds' : None, 'error' : str(err), 'results' : []}
+        report[path] = res
+        if res['success']:
+          log.info( f"ok      {res['seconds']:8.2f} s {path}" )
+        else:
+          log.error( f"FAILED  {res['seconds'] or 0:8.2f} s {path}" )
+          stop = stop or failFast
+  finally:
+    for _, owner in running.values():
+      owner.shutdown()
+    if executor is not None:
+      executor.shutdown()
+
+  for path in files:
+    if path not in report:
+      report[path] = {'name' : path, 'success' : None, 'seconds' : None, 'error' : 'Not built (fail fast)', 'results' : []}
+  return [report[path] for path in files]
+
+def summary( report ):
+  """
+  Summarize a batch report
+
+  Arguments:
+    report (list) : Output from runBatch()
+
+  Keyword arguments:
+    None.
+
+  Returns:
+    str : Counts of documents built, failed, and skipped, followed by one
+      line for each document that failed or was skipped
+
+  """
+
+  failed  = [res for res in report if res['success'] is False]
+  skipped = [res for res in report if res['success'] is None]
+  lines   = [f'{len(report) - len(failed) - len(skipped)} of {len(report)} document(s) built, '
+             f'{len(failed)} failed, {len(skipped)} skipped']
+  for res in failed:
+    lines.append( f"  FAILED   {res['name']}{': ' + res['error'] if res['error'] else ''}" )
+  for res in skipped:
+    lines.append( f"  SKIPPED  {res['name']}" )
+  return os.linesep.join( lines )
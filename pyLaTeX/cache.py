@@ -0,0 +1,86 @@
+import logging
+import os
+import json
+import hashlib
+
+CACHEDIR = os.path.join(
+  os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')),
+  'pyLaTeX'
+)
+
+def cacheDir( *args ):
+  """
+  Get path to (sub)directory of the pyLaTeX cache, creating it if needed
+
+  Arguments:
+    *args : Sub-directory names to join to the cache directory
+
+  Keyword arguments:
+    None.
+
+  Returns:
+    str : Path to the directory
+
+  """
+
+  path = os.path.join( CACHEDIR, *args )
+  os.makedirs( path, exist_ok=True )
+  return path
+
+def hashText( text ):
+  """Return hex digest of a str or bytes object"""
+
+  if isinstance(text, str):
+    text = text.encode()
+  return hashlib.sha1( text ).hexdigest()
+
+def hashFile( path ):
+  """Return hex digest of the contents of a file; None if it does not exist"""
+
+  if not os.path.isfile( path ):
+    return None
+  digest = hashlib.sha1()
+  with open(path, 'rb') as fid:
+    for chunk in iter(lambda: fid.read(2**20), b''):
+      digest.update( chunk )
+  return digest.hexdigest()
+
+class DocState( dict ):
+  """
+  Persistent, per-document build state
+
+  Behaves as a dictionary that is read from, and written to, a JSON file in
+  the cache directory. The file name is derived from the absolute path of
+  the TeX file so state never pollutes the source directory.
+
+  """
+
+  def __init__(self, texfile):
+    super().__init__()
+    self.log     = logging.getLogger(__name__)
+    self.texfile = os.path.abspath( texfile )
+    self.path    = os.path.join( cacheDir('state'), hashText(self.texfile) + '.json' )
+    self.load()
+
+  def load(self):
+    """Read state from disk; state is empty if file missing or corrupt"""
+
+    self.clear()
+    try:
+      with open(self.path, 'r') as fid:
+        self.update( json.load( fid ) )
+    except FileNotFoundError:
+      pass
+    except Exception as err:
+      self.log.warning( f'Failed to read build state {self.path}: {err}' )
+
+  def save(self):
+    """Write state to disk atomically"""
+
+    tmp = f'{self.path}.{os.getpid()}'
+    try:
+      with open(tmp, 'w') as fid:
+        json.dump( self, fid )
+      os.replace( tmp, self.path )
+    except Exception as err:
+      self.log.warning( f'Failed to write build state {self.path}: {err}' )
@@ -2,75 +2,138 @@
 
 # A python function to replace figure, table, and equation labels with numbers
 import os, re;
-import regex
-from .utils import recursiveRegex, getEnvironment
+from .utils import Balanced
 
-CAPTION = regex.compile( r'(\\caption({(?>[^{}]|(?2))*}))' )			# Pattern to grab full \caption{...} command and {...} contents
-LABEL   = recursiveRegex( r'\\label', ('{','}') )									# Pattern to grab {...} of \label{} command
+CAPTION = Balanced( r'\\caption' )                                              # Pattern to grab {...} of \caption{} command
+LABEL   = Balanced( r'\\label' )                                                # Pattern to grab {...} of \label{} command
+REF     = re.compile( r'\\(ref|eqref|autoref|cref|Cref)\*?{([^}]+)}' )          # Pattern for all reference commands
 
 class CrossRef(object):
   def __init__(self, label, *args):
     self.label      = label
     self.environs   = args
-    self.refs       = {}
-    self.num        = []
 
-  def sortEnvirons(self, text):
+  def process(self, text):
     '''
     Purpose:
-      Method to obtain and sort environments in text based
-      on the environments specified and initialization
+      Number the environments of this type and replace
+      references to them
     Inputs:
       text  : String with contents of tex file
     Keywords:
       None.
     Returns:
-      List of environment text, excluding \end{environ}, in order
-      of apperance in text
+      Updated text; see CrossRefEngine.process
     '''
-    pos   = []
-    match = []
-    for env in self.environs:																									# Iterate over all the environments defined
-      env = getEnvironment( env )																							# Create regex pattern for finding environments
-      for s in env.finditer( text ):																					# Iterate over all instances of the environment in the text
-        pos.append(   s.start() )																							# Append the starting postion of the match to the pos list
-        match.append( s.group() )																							# Append the contents of the match to the match list
-    if match: match = [m for _, m in sorted( zip(pos, match) ) ]							# Sort the matches based on the starting position
-    return match
-
-  def updateCaptions(self, text, environs):  
-    i = 0																																			# Initialize counter at zero
-    for env in environs:																											# Iterate over sorted matches
-      try:																																		# Try to
-        label = LABEL.findall( env )[0]
-      except:																																	# On exception, just continue
-        pass
-      else:																																		# On success
-        i    += 1																															# Incremnt i
-        self.refs.update( {label : i} )
-
-      try:
-        command, contents = CAPTION.findall( env )[0]													# Get full caption command and the contents of the caption command
-      except:
-        pass
-      else:
-        newContents  = '{{{} {}. {}}}'.format(self.label, i, contents[1:-1])		# Generate new caption contents that contain the object number
-        newCommand   = command.replace( contents, newContents )								# Replace old contents in full command with new contents
-        newEnv       = env.replace( command, newCommand )											# Replace old command with new command in environment
-        text         = text.replace( env, newEnv )														# Replace old evironment with updated environment in text
-        label        = LABEL.findall( env )[0]
-    return text																																# Return updated text
-
-  def updateRefs(self, text):
-    for key, val in self.refs.items():
-      key  = '\\ref{}'.format( key )
-      text = text.replace( key, '{}'.format(val) )
-    return text 
+    return CrossRefEngine( self ).process( text )
+
+class CrossRefEngine(object):
+  """
+  Number environments and resolve references in a single pass
+
+  Environments of all registered CrossRef types are located with one scan
+  of the text. Each environment with a \\label or \\caption is numbered,
+  counting separately for each type, and its caption is prefixed with the
+  type label and number (e.g., 'Figure 2. '). All \\ref, \\eqref, \\autoref,
+  and \\cref commands are then replaced in one substitution using a
+  dictionary of label numbers; references to unknown labels are left as is.
+
+  The engine keeps no state between calls, so it can be shared.
+
+  """
+
+  def __init__(self, *crossrefs):
+    self.crossrefs = crossrefs
+    self.types     = {env : ref for ref in crossrefs for env in ref.environs}   # Environment name -> CrossRef
+    names          = '|'.join( map(re.escape, self.types) )
+    self.pattern   = re.compile( r'\\(begin|end){(' + names + r')}' )
+
+  def environments(self, text):
+    """
+    Locate all registered environments
+
+    Arguments:
+      text (str) : Text to search
+
+    Keyword arguments:
+      None.
+
+    Returns:
+      list : (CrossRef, start, end) tuples of environment bodies, i.e.,
+        text between \\begin{} and \\end{}, in order of appearance
+
+    """
+
+    found = []
+    open_ = {}                                                                  # Environment name -> stack of body start offsets
+    for match in self.pattern.finditer( text ):
+      kind, name = match.groups()
+      if kind == 'begin':
+        open_.setdefault( name, [] ).append( (len(found), match.end()) )
+        found.append( None )                                                    # Placeholder keeps order of \begin
+      elif open_.get( name ):
+        index, start = open_[name].pop()
+        found[index] = (self.types[name], start, match.start())
+    return [env for env in found if env is not None]                            # Drop unclosed environments
 
   def process(self, text):
-    envs = self.sortEnvirons(text)
-    if envs:
-      text = self.updateCaptions( text, envs )
-      return self.updateRefs( text )
-    return text
+    """
+    Number captions and replace references
+
+    Arguments:
+      text (str) : Text to process
+
+    Keyword arguments:
+      None.
+
+    Returns:
+      str : Updated text
+
+    """
+
+    counters = {}
+    refs     = {}                                                               # Label -> (CrossRef, number)
+    edits    = []                                                               # (start, end, replacement) caption edits
+    for ref, start, end in self.environments( text ):
+      body     = text[start:end]
+      labels   = LABEL.findall( body )
+      captions = list( CAPTION.finditer( body ) )
+      if not labels and not captions:
+        continue
+
+      counters[ref] = num = counters.get(ref, 0) + 1
+      for label in labels:
+        refs.setdefault( label[1:-1], (ref, num) )
+
+      if captions:
+        contents = captions[0].groups()[-1]
+        offset   = start + captions[0].end() - len(contents)
+        edits.append( (offset, offset + len(contents),
+                       '{{{} {}. {}}}'.format(ref.label, num, contents[1:-1])) )
+
+    if not refs and not edits:
+      return text
+
+    chunks = []
+    pos    = 0
+    for start, end, new in sorted( edits ):
+      if start < pos: continue                                                  # Nested environment; already edited
+      chunks.extend( [text[pos:start], new] )
+      pos = end
+    chunks.append( text[pos:] )
+    text = ''.join( chunks )
+
+    return REF.sub( lambda match: self._format( match, refs ), text )
+
+  def _format(self, match, refs):
+    """Replacement text for a reference command"""
 
+    cmd, key = match.groups()
+    if key not in refs:
+      return match.group()
+    ref, num = refs[key]
+    if cmd == 'eqref':
+      return f'({num})'
+    elif cmd == 'ref':
+      return str(num)
+    return f'{ref.label} {num}'
@@ -0,0 +1,292 @@
+import logging
+import os, re
+from threading import Lock
+
+from .LaTeXBase import TEXROOT_PATTERN
+from .cache import DocState
+from .preamble import formatInputs
+from .recorder import parseRecorder
+from .utils import INPUT, readFile, _inComment, _resolveInput
+
+DOCCLASS = re.compile( r'^[ \t]*\\documentclass\b', re.MULTILINE )             # Uncommented \documentclass marks a root document
+BIBFILES = re.compile( r'\\(?:bibliography|addbibresource)(?:\[[^\]]*\])?{([^}]+)}' )
+GRAPHICS = re.compile( r'\\includegraphics\*?(?:\[[^\]]*\])?{([^}]+)}' )
+GRAPHEXT = ('.pdf', '.png', '.jpg', '.jpeg', '.eps')                            # Extensions tried for \includegraphics without one
+ARTIFACTS = ('_track_changes.tex', '_wBBL.tex', '_NoACRO.tex', '_partial.tex',   # Files written next to the source by pyLaTeX
+             '-converted-to.pdf')                                               # and the epstopdf package
+
+def findRoot( texFile ):
+  """
+  Follow '!TEX root = ...' magic comments to the root document
+
+  Arguments:
+    texFile (str) : Path to TeX file
+
+  Keyword arguments:
+    None.
+
+  Returns:
+    str : Absolute path to root document; texFile itself if it does not
+      name a root
+
+  """
+
+  path = os.path.abspath( texFile )
+  seen = set()
+  while path not in seen and os.path.isfile( path ):
+    seen.add( path )
+    root = TEXROOT_PATTERN.findall( readFile( path ) )
+    if len(root) != 1:
+      break
+    root = os.path.abspath( os.path.join( os.path.dirname(path), root[0].strip() ) )
+    if not os.path.isfile( root ):
+      break
+    path = root
+  return path
+
+def isRoot( texFile ):
+  """Check if a TeX file is a document that can be compiled on its own"""
+
+  try:
+    text = readFile( texFile )
+  except (OSError, UnicodeDecodeError):
+    return False
+  if len( TEXROOT_PATTERN.findall( text ) ) == 1:                               # Declares it is part of another document
+    return findRoot( texFile ) == os.path.abspath( texFile ) and DOCCLASS.search( text ) is not None
+  return DOCCLASS.search( text ) is not None
+
+def findRoots( topdir ):
+  """
+  Find root documents in a directory tree
+
+  Hidden directories (e.g., .git) and files written by pyLaTeX builds
+  (see ARTIFACTS) are skipped.
+
+  Arguments:
+    topdir (str) : Directory to search
+
+  Keyword arguments:
+    None.
+
+  Returns:
+    list : Sorted absolute paths of root documents; see isRoot()
+
+  """
+
+  roots = []
+  for dirpath, dirnames, filenames in os.walk( os.path.abspath(topdir) ):
+    dirnames[:] = [name for name in dirnames if not name.startswith('.')]       # Skip .git and the like
+    for name in filenames:
+      path = os.path.join( dirpath, name )
+      if name.endswith('.tex') and not name.endswith( ARTIFACTS ) and isRoot( path ):
+        roots.append( path )
+  return sorted( roots )
+
+def dependencies( texFile, topdir, base = None ):
+  """
+  Find the files a TeX file uses, following included TeX files
+
+  Arguments:
+    texFile (str) : Path to TeX file
+    topdir (str) : Directory of root document; paths in \\input, etc. are
+      relative to it, or to the import directory in files loaded with
+      \\import or \\subimport
+
+  Keyword arguments:
+    base (str) : Import directory texFile was loaded with; default is
+      topdir
+
+  Returns:
+    set : Absolute paths of texFile and all TeX, bibliography, and figure
+      files it uses; included TeX files that do not exist are also listed
+
+  """
+
+  texFile = os.path.abspath( texFile )
+  files   = {texFile}
+  stack   = [(texFile, base or topdir)]
+  while stack:
+    path, base = stack.pop()
+    try:
+      text = readFile( path )
+    except (OSError, UnicodeDecodeError):
+      continue
+    cwd = os.path.dirname( path )
+    for match in INPUT.finditer( text ):
+      if _inComment( text, match.start() ): continue
+      child, childBase = _resolveInput( match, topdir, cwd, base )
+      if child is not None and child not in files:
+        files.add( child )                                                      # Recorded even if missing, so creating it triggers a build
+        stack.append( (child, childBase) )
+    for match in BIBFILES.finditer( text ):
+      if _inComment( text, match.start() ): continue
+      for name in match.group(1).split(','):
+        name = name.strip()
+        if not name.endswith('.bib'): name += '.bib'
+        files.add( os.path.normpath( os.path.join( topdir, name ) ) )
+    for match in GRAPHICS.finditer( text ):
+      if _inComment( text, match.start() ): continue
+      name  = os.path.normpath( os.path.join( base, match.group(1).strip() ) )  # Relative to import directory, like \\input
+      found = [name + ext for ext in ('',) + GRAPHEXT if os.path.isfile( name + ext )]
+      files.update( found or [name] )
+  return files
+
+def chapters( root ):
+  """
+  Find the \\include'd files of a document and the files each one uses
+
+  Arguments:
+    root (str) : Path to root document
+
+  Keyword arguments:
+    None.
+
+  Returns:
+    dict : Keys are \\include arguments, as written, in document order;
+      values are sets of files used by the included file, see
+      dependencies()
+
+  """
+
+  root   = os.path.abspath( root )
+  topdir = os.path.dirname( root )
+  found  = {}
+  def scan( path, seen, base ):
+    try:
+      text = readFile( path )
+    except (OSError, UnicodeDecodeError):
+      return
+    for match in INPUT.finditer( text ):
+      if _inComment( text, match.start() ): continue
+      child, childBase = _resolveInput( match, topdir, os.path.dirname(path), base )
+      if child is None or child in seen:
+        continue
+      if match.group(1) == 'include':
+        found[ match.group(2).strip() ] = dependencies( child, topdir, childBase )
+      else:                                                                     # \include may be in an \input'ed file
+        scan( child, seen | {child}, childBase )
+  scan( root, {root}, topdir )
+  return found
+
+class DepIndex( object ):
+  """
+  Reverse dependency index mapping files to the root documents using them
+
+  Root documents (TeX files with an uncommented \\documentclass and no
+  '!TEX root' comment naming another file) are found by scanning a
+  directory tree once. The files each root depends on are found by
+  following \\input, \\include, \\subfile, \\import, and \\subimport from
+  the root, adding the files named by \\bibliography, \\addbibresource,
+  and \\includegraphics. Once a root has been compiled, the files the
+  engine read, according to its recorder (.fls) file and the manifest of
+  its preamble format, are added too.
+
+  The index is updated incrementally: a modified TeX file only causes
+  the roots using it to be traversed again.
+
+  """
+
+  def __init__(self, topdir):
+    self.__log  = logging.getLogger(__name__)
+    self.topdir = os.path.abspath( topdir )
+    self.deps   = {}                                                            # Root -> set of files it depends on
+    self.users  = {}                                                            # File -> set of roots depending on it
+    self._lock  = Lock()
+    self.scan()
+
+  def scan(self):
+    """Find and index all root documents under the top directory"""
+
+    for path in findRoots( self.topdir ):
+      self.addRoot( path )
+    self.__log.debug( f'Indexed {len(self.deps)} root document(s) under {self.topdir}' )
+
+  def roots(self, path):
+    """
+    Get root documents that depend on a file
+
+    Arguments:
+      path (str) : Path to file
+
+    Keyword arguments:
+      None.
+
+    Returns:
+      list : Sorted paths of root documents
+
+    """
+
+    with self._lock:
+      return sorted( self.users.get( os.path.abspath(path), () ) )
+
+  def addRoot(self, root):
+    """(Re)index the dependencies of a root document"""
+
+    root  = os.path.abspath( root )
+    files = self._traverse( root )
+    with self._lock:
+      self._drop( root )
+      self.deps[root] = files
+      for path in files:
+        self.users.setdefault( path, set() ).add( root )
+
+  def removeRoot(self, root):
+    """Remove a root document from the index"""
+
+    with self._lock:
+      self._drop( os.path.abspath(root) )
+
+  def update(self, path):
+    """
+    Update the index for a modified file
+
+    Arguments:
+      path (str) : Path to modified file
+
+    Keyword arguments:
+      None.
+
+    Returns:
+      list : Sorted paths of root documents that must be rebuilt; empty
+        if the file is not used by any root document
+
+    """
+
+    path = os.path.abspath( path )
+    if path.endswith('.tex'):
+      if isRoot( path ):
+        self.addRoot( path )
+      elif path in self.deps:                                                   # No longer a root document
+        self.removeRoot( path )
+
+      roots = self.roots( path )
+      if not roots:                                                             # Not included anywhere; try its '!TEX root' comment
+        root = findRoot( path )
+        if root != path and isRoot( root ):
+          roots = [root]
+      for root in roots:                                                        # Includes may have changed
+        if root != path: self.addRoot( root )
+      return sorted( set(roots).union( self.roots( path ) ) )
+    return self.roots( path )
+
+  def _drop(self, root):
+    """Remove root from the maps; lock must be held"""
+
+    for path in self.deps.pop( root, () ):
+      users = self.users.get( path, None )
+      if users is None: continue
+      users.discard( root )
+      if not users: del self.users[path]
+
+  def _traverse(self, root):
+    """Get set of files root depends on"""
+
+    files = dependencies( root, os.path.dirname(root) )
+    inputs, outputs = parseRecorder( '{}.fls'.format( os.path.splitext(root)[0] ) )
+    outputs = set( outputs )
+    fmt     = DocState( root ).get( 'format', None )                            # Files read into a preamble format are not
+    if fmt: inputs.extend( formatInputs( fmt ) )                                # in the recorder data of the compile
+    for path in inputs:                                                         # Local files read by the engine, e.g., .sty
+      if path.startswith( self.topdir + os.sep ) and path not in outputs:
+        files.add( path )
+    return files
@@ -0,0 +1,82 @@
+from .utils import Balanced
+
+BRACES = Balanced( '' )                                                         # Only its scan() is used
+
+class DocIndex( object ):
+  """
+  Index of command occurrences in a LaTeX document
+
+  The text is scanned once; every command is recorded with its offset and
+  the spans of the brace delimited arguments that directly follow it.
+  Escaped braces and comments are skipped. An argument whose opening brace
+  is never closed is not recorded.
+
+  """
+
+  def __init__(self, text):
+    self.text     = text
+    self.commands = {}                                                          # Command name -> list of (offset, argument spans)
+    self._scan()
+
+  def _scan(self):
+    """Match braces and record commands; the scan is shared with Balanced"""
+
+    closing, found = BRACES.scan( self.text )
+    for name, start, end in found:
+      self.commands.setdefault( name, [] ).append( (start, self._args(end, closing)) )
+
+  def _args(self, pos, closing):
+    """Return spans, including braces, of arguments starting at pos"""
+
+    text  = self.text
+    spans = []
+    while True:
+      while pos < len(text) and text[pos] in ' \t':                             # Skip spaces, but not blank lines
+        pos += 1
+      if pos < len(text) and text[pos] == '[' and not spans:                    # Skip an optional argument
+        end = text.find( ']', pos )
+        if end < 0: break
+        pos = end + 1
+        continue
+      if pos >= len(text) or text[pos] != '{' or pos not in closing:
+        break
+      spans.append( (pos, closing[pos]+1) )
+      pos = closing[pos] + 1
+    return spans
+
+  def find(self, name):
+    """
+    Get all occurrences of a command
+
+    Arguments:
+      name (str) : Command name without the backslash
+
+    Keyword arguments:
+      None.
+
+    Returns:
+      list : (offset, spans) tuples where spans is a list of (start, end)
+        offsets of the arguments, including braces
+
+    """
+
+    return self.commands.get( name, [] )
+
+  def arguments(self, name, index = 0):
+    """
+    Get the text of an argument for all occurrences of a command
+
+    Arguments:
+      name (str) : Command name without the backslash
+
+    Keyword arguments:
+      index (int) : Which argument to return; default is first
+
+    Returns:
+      list : Argument text, including braces, for each occurrence of the
+        command that has the requested argument
+
+    """
+
+    return [ self.text[ spans[index][0]:spans[index][1] ]
+      for _, spans in self.find( name ) if len(spans) > index ]
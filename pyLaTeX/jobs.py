@@ -0,0 +1,57 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+def _run( name, func, kwargs ):
+  """Run one job, catching errors, and return its report entry"""
+
+  log = logging.getLogger(__name__)
+  t0  = time.perf_counter()
+  try:
+    res   = func( **kwargs )
+    error = None
+  except Exception as err:
+    log.exception( f'Job failed: {name}' )
+    res   = False
+    error = str(err)
+  return {'name'    : name,
+          'success' : bool(res),
+          'seconds' : time.perf_counter() - t0,
+          'error'   : error,
+          'result'  : res}
+
+def runJobs( jobs, workers = 1 ):
+  """
+  Run independent build jobs in parallel
+
+  Jobs are run in a thread pool; the heavy lifting of each job happens in
+  subprocesses (engine, bibtex, latexdiff, pandoc), so threads are enough
+  to keep several cores busy. With one worker, jobs run in order.
+
+  Arguments:
+    jobs (list) : (name, callable, kwargs) tuples. A job succeeds if the
+      callable returns something true (e.g., a successful BuildResult)
+      and does not raise an exception.
+
+  Keyword arguments:
+    workers (int) : Maximum number of jobs to run at once
+
+  Returns:
+    list : Report dicts, in order of jobs, with keys name, success,
+      seconds, error, and result (value returned by the callable)
+
+  """
+
+  log = logging.getLogger(__name__)
+  t0  = time.perf_counter()
+  with ThreadPoolExecutor( max_workers = max(1, workers or 1) ) as pool:
+    futures = [pool.submit( _run, *job ) for job in jobs]
+    report  = [future.result() for future in futures]
+
+  for res in report:
+    if res['success']:
+      log.info( f"{res['name']:<16} ok      {res['seconds']:8.2f} s" )
+    else:
+      log.error( f"{res['name']:<16} FAILED  {res['seconds']:8.2f} s {res['error'] or ''}" )
+  log.info( f"{'total':<16}         {time.perf_counter() - t0:8.2f} s" )
+  return report
@@ -0,0 +1,233 @@
+import logging
+import os
+import time
+import json
+import threading
+from contextlib import contextmanager
+
+_ACTIVE = threading.local()                                                     # Result that stages of the current thread are added to
+
+def active( ):
+  """Return the BuildResult stages are currently recorded in; None if none"""
+
+  stack = getattr( _ACTIVE, 'stack', None )
+  return stack[-1] if stack else None
+
+def record( name, wall, cpu = None, kind = 'process', **info ):
+  """
+  Add a stage to the active BuildResult of this thread, if any
+
+  Arguments:
+    name (str) : Name of stage, e.g., 'pdflatex', 'bibtex', 'crossref'
+    wall (float) : Wall time in seconds
+
+  Keyword arguments:
+    cpu (float) : CPU time in seconds; None if not known
+    kind (str) : 'process' for subprocesses, 'python' for Python code
+    **info : Other information to store with the stage, e.g., returncode
+
+  Returns:
+    None.
+
+  """
+
+  result = active()
+  if result is not None:
+    result.add( name, wall, cpu, kind, **info )
+
+@contextmanager
+def stage( name, **info ):
+  """Time the Python code in a with block as a stage of the active result"""
+
+  t0, c0 = time.perf_counter(), time.thread_time()
+  try:
+    yield
+  finally:
+    record( name, time.perf_counter() - t0, time.thread_time() - c0, 'python', **info )
+
+def waitProcess( proc ):
+  """
+  Wait for a subprocess to finish and get the CPU time it used
+
+  Arguments:
+    proc (Popen) : Process to wait for; its returncode is set
+
+  Keyword arguments:
+    None.
+
+  Returns:
+    float : User plus system CPU seconds of the process (and any children
+      it waited for); None if not available on this platform
+
+  """
+
+  if not hasattr( os, 'wait4' ):
+    proc.wait()
+    return None
+  try:
+    _, status, usage = os.wait4( proc.pid, 0 )
+  except ChildProcessError:                                                     # Already reaped
+    proc.wait()
+    return None
+  proc.returncode = os.waitstatus_to_exitcode( status )
+  return usage.ru_utime + usage.ru_stime
+
+def _labels( **kwargs ):
+  """Format Prometheus labels, escaping values"""
+
+  escape = lambda val: str(val).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+  return '{' + ','.join( f'{key}="{escape(val)}"' for key, val in kwargs.items() ) + '}'
+
+class BuildResult( object ):
+  """
+  Outcome and timings of a build job (compile, tracked changes, export)
+
+  A result collects one stage for every subprocess run and every timed
+  Python transform while it is active, i.e., inside a 'with' block in the
+  thread that entered it. Results nest: the innermost active result gets
+  the stages. Truth value is whether the job succeeded, so a result can be
+  used wherever a bool was returned before.
+
+  """
+
+  def __init__(self, job, texfile = None):
+    self.job      = job
+    self.texfile  = texfile
+    self.success  = False
+    self.passes   = []                                                          # Reasons for engine passes, if any
+    self.stages   = []                                                          # Dicts with name, kind, wall, cpu, ...
+    self.start    = time.time()
+    self.wall     = None
+    self._t0      = None
+
+  def __bool__(self):
+    return bool( self.success )
+
+  def __repr__(self):
+    return f'<BuildResult {self.job} success={self.success} wall={self.wall}>'
+
+  def __enter__(self):
+    if not hasattr( _ACTIVE, 'stack' ):
+      _ACTIVE.stack = []
+    _ACTIVE.stack.append( self )
+    self._t0 = time.perf_counter()
+    return self
+
+  def __exit__(self, *args):
+    _ACTIVE.stack.remove( self )
+    self.wall = time.perf_counter() - self._t0
+    return False
+
+  def add(self, name, wall, cpu = None, kind = 'process', **info):
+    """Add a stage; see record()"""
+
+    self.stages.append( dict( name = name, kind = kind, wall = wall, cpu = cpu, **info ) )
+
+  def extend(self, other):
+    """Add stages and passes of a nested result, e.g., compile of latexdiff output"""
+
+    self.stages.extend( other.stages )
+    self.passes.extend( other.passes )
+
+  @property
+  def cpu(self):
+    """Total CPU seconds of all stages with a known CPU time"""
+
+    return sum( stage['cpu'] for stage in self.stages if stage['cpu'] is not None )
+
+  def totals(self):
+    """
+    Sum stages by name
+
+    Returns:
+      dict : Keys are (name, kind) tuples, values are dicts with wall, cpu,
+        and runs
+
+    """
+
+    totals = {}
+    for stage in self.stages:
+      total = totals.setdefault( (stage['name'], stage['kind']), {'wall' : 0.0, 'cpu' : 0.0, 'runs' : 0} )
+      total['wall'] += stage['wall']
+      total['cpu']  += stage['cpu'] or 0.0
+      total['runs'] += 1
+    return totals
+
+  def toDict(self):
+    """Return result as JSON serializable dict"""
+
+    return {'job'     : self.job,
+            'texfile' : self.texfile,
+            'success' : bool(self.success),
+            'start'   : self.start,
+            'wall'    : self.wall,
+            'cpu'     : self.cpu,
+            'passes'  : list(self.passes),
+            'stages'  : list(self.stages)}
+
+def writeJSONLines( path, *results ):
+  """Append results to a file, one JSON object per line"""
+
+  with open(path, 'a') as fid:
+    for result in results:
+      fid.write( json.dumps( result.toDict() ) + '\n' )
+
+def writePrometheus( path, *results ):
+  """
+  Write results in the Prometheus text format
+
+  The file is replaced atomically, as required by the textfile collector of
+  the node exporter. Stage metrics are summed per stage name.
+
+  Arguments:
+    path (str) : File to write, should end in '.prom'
+    *results : BuildResult instances; for a document and job given more
+      than once, the last one is used
+
+  Keyword arguments:
+    None.
+
+  Returns:
+    None.
+
+  """
+
+  latest = {}
+  for result in results:
+    latest[ (result.texfile, result.job) ] = result
+
+  metrics = {
+    'pylatex_build_success'          : ('gauge', 'Whether the last build succeeded',            []),
+    'pylatex_build_duration_seconds' : ('gauge', 'Wall time of the last build',                 []),
+    'pylatex_build_cpu_seconds'      : ('gauge', 'CPU time of the stages of the last build',    []),
+    'pylatex_build_passes'           : ('gauge', 'Engine passes run by the last build',         []),
+    'pylatex_build_timestamp_seconds': ('gauge', 'Unix time the last build started',            []),
+    'pylatex_stage_duration_seconds' : ('gauge', 'Wall time of a stage in the last build',      []),
+    'pylatex_stage_cpu_seconds'      : ('gauge', 'CPU time of a stage in the last build',       []),
+    'pylatex_stage_runs'             : ('gauge', 'Times a stage was run in the last build',     []),
+  }
+  for (texfile, job), result in latest.items():
+    labels = dict( document = texfile or '', job = job )
+    metrics['pylatex_build_success'][2].append(           (_labels(**labels), int(bool(result))) )
+    metrics['pylatex_build_duration_seconds'][2].append(  (_labels(**labels), result.wall or 0.0) )
+    metrics['pylatex_build_cpu_seconds'][2].append(       (_labels(**labels), result.cpu) )
+    metrics['pylatex_build_passes'][2].append(            (_labels(**labels), len(result.passes)) )
+    metrics['pylatex_build_timestamp_seconds'][2].append( (_labels(**labels), result.start) )
+    for (name, kind), total in result.totals().items():
+      stageLabels = _labels( stage = name, kind = kind, **labels )
+      metrics['pylatex_stage_duration_seconds'][2].append( (stageLabels, total['wall']) )
+      metrics['pylatex_stage_cpu_seconds'][2].append(      (stageLabels, total['cpu']) )
+      metrics['pylatex_stage_runs'][2].append(             (stageLabels, total['runs']) )
+
+  lines = []
+  for name, (kind, desc, samples) in metrics.items():
+    lines.extend( [f'# HELP {name} {desc}', f'# TYPE {name} {kind}'] )
+    lines.extend( f'{name}{labels} {value}' for labels, value in samples )
+
+  tmp = f'{path}.{os.getpid()}'
+  try:
+    with open(tmp, 'w') as fid:
+      fid.write( '\n'.join(lines) + '\n' )
+    os.replace( tmp, path )
+  except Exception as err:
+    logging.getLogger(__name__).warning( f'Failed to write metrics {path}: {err}' )
@@ -0,0 +1,184 @@
+import logging
+import os, re
+import hashlib
+
+# Messages written to the log by the kernel and common packages when
+# another engine pass is required; keys are used as the pass reason
+RERUN_PATTERNS = {
+  'cross-references changed' : re.compile( r'Rerun to get cross-references right' ),
+  'citations changed'        : re.compile( r'Rerun to get citations correct' ),
+  'outlines changed'         : re.compile( r'Rerun to get outlines right' ),
+  'labels changed'           : re.compile( r'Label\(s\) may have changed' ),
+  'natbib citations changed' : re.compile( r'Package natbib Warning: Citation\(s\) may have changed' ),
+  'rerunfilecheck'           : re.compile( r'Package rerunfilecheck Warning: File `[^\']+\' has changed' ),
+  'hyperref'                 : re.compile( r'Package hyperref Warning: Rerun' ),
+  'rerun requested'          : re.compile( r'(?:Please rerun LaTeX|Rerun LaTeX)' ),
+}
+
+# Extensions of files written by one pass and read back by the next
+FINGERPRINT_EXTS = ('.toc', '.lof', '.lot', '.out', '.nav', '.snm')
+
+MAX_PRINT_LINE = 79                                                             # TeX wraps log lines at this many characters
+
+def readLog( logFile ):
+  """
+  Read an engine log file, undoing TeX's hard line wrapping
+
+  TeX breaks every log line at max_print_line characters, which can split
+  a warning message across lines. Lines of exactly that length are joined
+  with the line that follows them so patterns can match the full message.
+
+  Arguments:
+    logFile (str) : Path to the log file
+
+  Keyword arguments:
+    None.
+
+  Returns:
+    str : Text of the log file; empty string if file does not exist
+
+  """
+
+  if not os.path.isfile( logFile ):
+    return ''
+  with open(logFile, 'r', errors='replace') as fid:
+    lines = fid.read().splitlines()
+
+  text = []
+  for line in lines:
+    text.append( line )
+    if len(line) != MAX_PRINT_LINE:                                             # If line was not wrapped by TeX
+      text.append( os.linesep )                                                 # Add the line break back
+  return ''.join( text )
+
+def rerunReasons( logFile ):
+  """
+  Parse engine log for messages requesting another pass
+
+  Arguments:
+    logFile (str) : Path to the log file
+
+  Keyword arguments:
+    None.
+
+  Returns:
+    list : Reasons (keys of RERUN_PATTERNS) found in the log
+
+  """
+
+  text = readLog( logFile )
+  return [key for key, pattern in RERUN_PATTERNS.items() if pattern.search(text)]
+
+def fingerprint( *args ):
+  """
+  Compute content hashes for files read back by the engine
+
+  Files that do not exist, or that contain only \\relax lines, are treated
+  as empty so that a freshly created aux file for a document without any
+  labels does not force another pass.
+
+  Arguments:
+    *args : Any number of file paths
+
+  Keyword arguments:
+    None.
+
+  Returns:
+    dict : Keys are file paths, values are hex digests
+
+  """
+
+  data = {}
+  for path in args:
+    content = b''
+    if os.path.isfile( path ):
+      with open(path, 'rb') as fid:
+        content = fid.read()
+      if not content.replace(b'\\relax', b'').strip():                          # Only \relax in the file
+        content = b''
+    data[path] = hashlib.sha1( content ).hexdigest()
+  return data
+
+class PassScheduler( object ):
+  """
+  Decide how many engine passes a document needs
+
+  After every pass, the log is checked for rerun messages and the files
+  that the next pass will read (aux, toc, out, ...) are compared with their
+  state before the pass. Another pass is scheduled only if one of these
+  signals is present, up to a maximum number of passes.
+
+  """
+
+  def __init__(self, texfile, maxPasses = 5):
+    self.log       = logging.getLogger(__name__)
+    self.jobname   = os.path.splitext( texfile )[0]
+    self.maxPasses = maxPasses
+    self.passes    = []                                                         # List of reasons for each pass run
+    self._before   = {}
+
+  @property
+  def logFile(self):
+    return f'{self.jobname}.log'
+
+  def trackedFiles(self, auxFiles):
+    """Return list of files to fingerprint; aux files plus toc, out, etc."""
+
+    return list(auxFiles) + [self.jobname + ext for ext in FINGERPRINT_EXTS]
+
+  def start(self, reason, auxFiles):
+    """
+    Record state before a pass runs
+
+    Arguments:
+      reason (str,list) : Why the pass is being run
+      auxFiles (list) : Aux files known before the pass
+
+    Keyword arguments:
+      None.
+
+    Returns:
+      None.
+
+    """
+
+    if isinstance(reason, (list, tuple,)):
+      reason = ', '.join( reason )
+    self.passes.append( reason )
+    self._before = fingerprint( *self.trackedFiles( auxFiles ) )
+    self.log.info( f'Pass {len(self.passes)}: {reason}' )
+
+  def check(self, auxFiles):
+    """
+    Determine whether another pass is required
+
+    Arguments:
+      auxFiles (list) : Aux files known after the pass
+
+    Keyword arguments:
+      None.
+
+    Returns:
+      list : Reasons for running another pass; empty if converged
+
+    """
+
+    reasons = rerunReasons( self.logFile )
+    after   = fingerprint( *self.trackedFiles( auxFiles ) )
+    empty   = fingerprint( '' )['']                                             # Digest of a missing file
+    for path, digest in after.items():
+      if self._before.get(path, empty) != digest:
+        reasons.append( f'{os.path.basename(path)} changed' )
+    return reasons
+
+  def converged(self, reasons):
+    """Return True if no more passes should be run, logging if capped"""
+
+    if not reasons:
+      return True
+    if len(self.passes) >= self.maxPasses:
+      self.log.warning(
+        f'Stopping after {self.maxPasses} passes; document has not converged: {", ".join(reasons)}'
+      )
+      return True
+    return False
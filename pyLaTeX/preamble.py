@@ -0,0 +1,202 @@
+import logging
+import os, re
+import json
+import shutil
+import threading
+
+from .cache import cacheDir, hashText
+from .recorder import buildManifest, manifestChanged
+
+ENDPREAMBLE = re.compile( r'^[ \t]*\\(?:begin{document}|endofdump)', re.MULTILINE ) # mylatexformat dumps up to either of these
+DUMPER      = 'mylatexformat.ltx'
+
+def splitPreamble( text ):
+  """
+  Get the preamble of a document
+
+  Arguments:
+    text (str) : Text of root TeX file
+
+  Keyword arguments:
+    None.
+
+  Returns:
+    str : Text before \\begin{document} or \\endofdump, whichever is first;
+      None if there is neither
+
+  """
+
+  match = ENDPREAMBLE.search( text )
+  return None if match is None else text[:match.start()]
+
+def formatInputs( name ):
+  """
+  Get files read when a preamble format was dumped
+
+  Arguments:
+    name (str) : Name of format
+
+  Keyword arguments:
+    None.
+
+  Returns:
+    list : Paths of files in the manifest of the format; empty if the
+      format has no manifest
+
+  """
+
+  try:
+    with open( os.path.join( cacheDir('formats'), f'{name}.json' ), 'r' ) as fid:
+      return list( json.load( fid ) )
+  except Exception:
+    return []
+
+class PreambleFormat( object ):
+  """
+  Engine format file with the preamble of a document precompiled
+
+  The format is built with mylatexformat and stored in the 'formats'
+  directory of the pyLaTeX cache under a name derived from the preamble
+  text, the engine, and the TeX Live installation, so changing any of
+  these selects a different format. The files read while dumping the
+  format (e.g., local .sty files) are recorded in a manifest next to it;
+  a change to any of them invalidates the format.
+
+  When a document is compiled with the format, the engine skips the
+  preamble of the document and starts at \\begin{document}.
+
+  """
+
+  def __init__(self, texfile, engine):
+    """
+    Arguments:
+      texfile (str) : Path to root TeX file
+      engine (str) : Path to engine (pdflatex, xelatex) binary
+
+    """
+
+    self.log     = logging.getLogger(__name__)
+    self.texfile = os.path.abspath( texfile )
+    self.engine  = engine
+    self.dir     = cacheDir('formats')
+    with open(self.texfile, 'r', errors='replace') as fid:
+      preamble = splitPreamble( fid.read() )
+
+    if preamble is None:
+      self.name = None
+      return
+    binary = shutil.which( engine )
+    stamp  = os.stat( binary ).st_mtime_ns if binary else None                  # Changes when the engine is updated
+    key    = os.linesep.join( [engine, str(stamp), os.path.dirname(self.texfile), preamble] )
+    self.name = '{}-{}'.format( os.path.basename(engine), hashText(key) )
+
+  @property
+  def path(self):
+    return os.path.join( self.dir, f'{self.name}.fmt' )
+
+  def env(self):
+    """Environment for running the engine so it finds the format"""
+
+    paths = os.environ.get( 'TEXFORMATS', '' )
+    return dict( os.environ, TEXFORMATS = os.pathsep.join( [self.dir, paths] ) ) # Trailing separator keeps default search path
+
+  def option(self):
+    """Command line option to load the format"""
+
+    return f'-fmt={self.name}'
+
+  def isValid(self):
+    """Check if the format exists and nothing it was built from changed"""
+
+    if not os.path.isfile( self.path ):
+      return False
+    path = os.path.join( self.dir, f'{self.name}.json' )
+    try:
+      with open( path, 'r' ) as fid:
+        manifest = json.load( fid )
+    except Exception:
+      return False
+    refreshed = []
+    changed   = manifestChanged( manifest, refreshed )
+    if changed:
+      self.log.debug( f'Preamble dependency changed: {changed}' )
+      return False
+    if refreshed:                                                               # Store new stats of touched files
+      tmp = f'{path}.{os.getpid()}.{threading.get_ident()}'
+      try:
+        with open( tmp, 'w' ) as fid:
+          json.dump( manifest, fid )
+        os.replace( tmp, path )
+      except OSError as err:
+        self.log.debug( f'Failed to update preamble manifest: {err}' )
+    return True
+
+  def command(self, jobname):
+    """
+    Command to dump the format
+
+    Arguments:
+      jobname (str) : Job name to build the format under; see install()
+
+    Keyword arguments:
+      None.
+
+    Returns:
+      list : Command to run in directory of TeX file
+
+    """
+
+    return [self.engine, '-ini', '-interaction=nonstopmode', '-recorder',
+            f'-jobname={jobname}', f'-output-directory={self.dir}',
+            '&{}'.format( os.path.basename(self.engine) ), DUMPER,
+            os.path.basename( self.texfile )]
+
+  def jobname(self):
+    """Unique job name so concurrent builds of one format do not collide"""
+
+    return f'{self.name}.{os.getpid()}.{threading.get_ident()}'
+
+  def install(self, jobname):
+    """
+    Move a dumped format into place and record its manifest
+
+    Arguments:
+      jobname (str) : Job name the format was built under
+
+    Keyword arguments:
+      None.
+
+    Returns:
+      bool : True if the format was installed
+
+    """
+
+    job = os.path.join( self.dir, jobname )
+    try:
+      if not os.path.isfile( f'{job}.fmt' ):
+        return False
+      manifest = buildManifest( f'{job}.fls' ) or {}
+      manifest.pop( self.texfile, None )                                        # Preamble is part of the name; body may change freely
+      with open( f'{job}.json', 'w' ) as fid:
+        json.dump( manifest, fid )
+      os.replace( f'{job}.json', os.path.join( self.dir, f'{self.name}.json' ) )
+      os.replace( f'{job}.fmt',  self.path )
+      return True
+    finally:
+      self.clean( jobname )
+
+  def clean(self, jobname):
+    """Remove files left over from building a format"""
+
+    for ext in ('.fmt', '.fls', '.log', '.json'):
+      path = os.path.join( self.dir, jobname + ext )
+      if os.path.isfile( path ):
+        os.remove( path )
+
+  def remove(self, name):
+    """Remove another format of the same document, e.g., for an old preamble"""
+
+    for ext in ('.fmt', '.json'):
+      path = os.path.join( self.dir, name + ext )
+      if os.path.isfile( path ):
+        os.remove( path )
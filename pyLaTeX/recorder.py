@@ -0,0 +1,109 @@
+import os
+
+from .cache import hashFile
+
+def parseRecorder( flsFile ):
+  """
+  Parse the .fls file written by the engine's -recorder option
+
+  Arguments:
+    flsFile (str) : Path to the .fls file
+
+  Keyword arguments:
+    None.
+
+  Returns:
+    tuple : Lists of absolute paths of INPUT and OUTPUT files, in order of
+      first appearance and without duplicates. Both lists are empty if
+      the file does not exist.
+
+  """
+
+  inputs  = {}                                                                  # Dicts used as ordered sets
+  outputs = {}
+  if not os.path.isfile( flsFile ):
+    return [], []
+
+  pwd = os.path.dirname( os.path.abspath(flsFile) )
+  with open(flsFile, 'r', errors='replace') as fid:
+    for line in fid:
+      key, _, path = line.rstrip('\r\n').partition(' ')
+      if key == 'PWD':
+        pwd = path
+      elif key in ('INPUT', 'OUTPUT'):
+        path = os.path.normpath( os.path.join(pwd, path) )
+        if key == 'INPUT':
+          inputs[path] = None
+        else:
+          outputs[path] = None
+  return list(inputs), list(outputs)
+
+def buildManifest( flsFile, extra = () ):
+  """
+  Build dependency manifest from recorder data
+
+  Every file read by the engine that it did not also write itself (e.g.,
+  aux and toc files) is recorded with its size, modification time, and
+  content hash.
+
+  Arguments:
+    flsFile (str) : Path to the .fls file
+
+  Keyword arguments:
+    extra (iterable) : Paths of files read by other programs, e.g., the
+      .bib and .bst files read by BibTeX, to record as well
+
+  Returns:
+    dict : Keys are file paths, values are [size, mtime_ns, hash] lists;
+      None if there is no recorder data
+
+  """
+
+  inputs, outputs = parseRecorder( flsFile )
+  if not inputs:
+    return None
+
+  outputs  = set(outputs)
+  manifest = {}
+  for path in inputs + [os.path.abspath(path) for path in extra]:
+    if path in outputs or not os.path.isfile(path):
+      continue
+    stat = os.stat( path )
+    manifest[path] = [stat.st_size, stat.st_mtime_ns, hashFile(path)]
+  return manifest
+
+def manifestChanged( manifest, refreshed = None ):
+  """
+  Check if any file in a dependency manifest has changed
+
+  Size and modification time are checked first; the file is only hashed
+  if either differs, so an unchanged tree costs one stat call per file.
+  If a file was touched but its content is unchanged, its new size and
+  modification time are written into manifest, so once the caller saves
+  the manifest, the file is not hashed again.
+
+  Arguments:
+    manifest (dict) : Output from buildManifest(); updated in place
+
+  Keyword arguments:
+    refreshed (list) : If given, paths whose entry in manifest was
+      updated are appended, so the caller knows to save it
+
+  Returns:
+    str : Path of first changed file; None if nothing has changed
+
+  """
+
+  for path, (size, mtime, digest) in manifest.items():
+    try:
+      stat = os.stat( path )
+    except OSError:
+      return path
+    if stat.st_size == size and stat.st_mtime_ns == mtime:
+      continue
+    if stat.st_size != size or hashFile(path) != digest:
+      return path
+    manifest[path] = [stat.st_size, stat.st_mtime_ns, digest]                   # Touched only; skip hashing next time
+    if refreshed is not None:
+      refreshed.append( path )
+  return None
@@ -1,11 +1,11 @@
 import os, re
-from pylatexenc.latexencode import unicode_to_latex
 
 nTabs   = 4
 tabStop = 4
 offset  = nTabs * tabStop
 
 def encodeLaTeX( text ):
+    from pylatexenc.latexencode import unicode_to_latex    # Imported on first use; slow to import
     text = unicode_to_latex( text )
     text = text.replace( '\\textquotedblleft',  "``" )
     text = text.replace( '\\textquotedblright', "''" )
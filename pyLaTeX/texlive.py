@@ -0,0 +1,127 @@
+import logging
+import os
+import json
+import shutil
+
+from .cache import cacheDir
+
+LATEST    = 'Latest'                                                            # Name of latest TeX Live directory
+ENGINE    = 'pdflatex'                                                          # Program used to locate TeX Live
+CACHEFILE = 'texlive.json'
+
+_VERSIONS = None                                                                # In-process cache of versions
+_WARNED   = False                                                               # Missing engine logged already
+
+def _mtimes( *args ):
+  """Return dict of modification times for directories that exist"""
+
+  return {path : os.stat(path).st_mtime_ns for path in args if os.path.isdir(path)}
+
+def _discover( ):
+  """
+  Locate TeX Live installation(s) by searching PATH for the engine
+
+  If the engine is found in a 'Latest' directory, all numbered version
+  directories next to it are also returned.
+
+  Arguments:
+    None.
+
+  Keyword arguments:
+    None.
+
+  Returns:
+    tuple : Dictionary of versions and list of directories whose
+      modification times should invalidate the result
+
+  """
+
+  global _WARNED
+  cmd = shutil.which( ENGINE )
+  if cmd is None:
+    if not _WARNED:
+      logging.getLogger(__name__).warning( f'Could not find {ENGINE} on PATH' )
+      _WARNED = True
+    return {LATEST : ''}, []
+
+  cmd      = os.path.dirname( cmd )                                             # Get directory of command
+  versions = {}
+  watch    = [cmd]
+  if LATEST in cmd:                                                             # If latest string is in the directory path
+    root, sub = cmd.split( LATEST, 1 )                                          # Split on the latest string
+    if sub.startswith( os.sep ): sub = sub[1:]                                  # Remove leading /
+
+    vers = [ver for ver in os.listdir(root) if ver.isdigit()]                   # Get list of versions in the latex directory
+    versions.update( {ver : os.path.join(root, ver, sub) for ver in vers} )     # Build paths to all versions
+    watch.append( root )
+
+  versions[ LATEST ] = cmd                                                      # Set command
+  return versions, watch
+
+def _loadCache( ):
+  """Return cached versions if PATH and install directories unchanged"""
+
+  try:
+    with open( os.path.join( cacheDir(), CACHEFILE ), 'r' ) as fid:
+      data = json.load( fid )
+  except Exception:
+    return None
+
+  if data.get('PATH') != os.environ.get('PATH', ''):
+    return None
+  if _mtimes( *data.get('mtimes', {}) ) != data.get('mtimes'):
+    return None
+  return data.get('versions')
+
+def _saveCache( versions, watch ):
+  """Write discovered versions to disk cache"""
+
+  data = {
+    'PATH'     : os.environ.get('PATH', ''),
+    'mtimes'   : _mtimes( *watch ),
+    'versions' : versions,
+  }
+  try:
+    with open( os.path.join( cacheDir(), CACHEFILE ), 'w' ) as fid:
+      json.dump( data, fid )
+  except Exception as err:
+    logging.getLogger(__name__).debug( f'Failed to write TeX Live cache: {err}' )
+
+def getVersions( refresh = False ):
+  """
+  Get available TeX Live versions
+
+  Versions are discovered on first call and cached both in-process and on
+  disk. The disk cache is keyed by PATH and the modification times of the
+  installation directories, so installing a new version invalidates it.
+  If the engine is not found, nothing is cached.
+
+  Arguments:
+    None.
+
+  Keyword arguments:
+    refresh (bool) : Set to ignore all caches and search again
+
+  Returns:
+    dict : Keys are version names ('Latest', '2023', ...), values are
+      directories containing the TeX binaries
+
+  """
+
+  global _VERSIONS
+  if _VERSIONS is not None and not refresh:
+    return _VERSIONS
+
+  versions = None if refresh else _loadCache()
+  if versions is None:
+    versions, watch = _discover()
+    if not versions[LATEST]:                                                    # Not found; not cached, so installing TeX
+      return versions                                                           # Live later is picked up on the next call
+    _saveCache( versions, watch )
+  _VERSIONS = versions
+  return _VERSIONS
+
+def refresh( ):
+  """Discard cached TeX Live versions and search again"""
+
+  return getVersions( refresh = True )
@@ -1,50 +1,149 @@
 import logging
-import os, re, regex
+import os, re
+import atexit
+from bisect import bisect_right
 from subprocess import Popen, DEVNULL, STDOUT, PIPE
+from threading import Lock
 
-INPUT     = regex.compile( r'((?:\\input|\\include){([^\}]+)})' )
-COMMENT   = regex.compile( r'(?<!\\)(%[^\n\r]*)' )	# Grab instance of % and all following characters IF the % is NOT preceded by \ (backslash)
+INPUT     = re.compile( r'\\(input|include|subfile|import|subimport)\*?{([^\}]+)}(?:{([^\}]+)})?' )
+FILECACHE = {}                                                                  # Path -> ((mtime, size), text) for readFile()
+GITREADERS = {}                                                                 # Repository root -> GitBlobReader
+GITLOCK   = Lock()
+COMMENT   = re.compile( r'(?<!\\)(%[^\n\r]*)' )	# Grab instance of % and all following characters IF the % is NOT preceded by \ (backslash)
 ENVIRON   = r'\\begin{{{}}}((?:(?!\\end{{{}}}).|\n|\r)*)'
-RECURSIVE = r'{}({}(?>[^{}{}]|(?{}))*{})' 
+TOKEN     = r'\\([A-Za-z@]+)\*?|\\.|%[^\n\r]*|[{}{}]'                          # Control word, control symbol, comment, or delimiter
+
+class BalancedMatch( object ):
+  """Result of a Balanced search; mimics the parts of re.Match that are used"""
+
+  def __init__(self, text, start, end, groups):
+    self.string  = text
+    self._start  = start
+    self._end    = end
+    self._groups = groups
+
+  def start(self):
+    return self._start
+  def end(self):
+    return self._end
+  def group(self, index = 0):
+    return self.string[self._start:self._end] if index == 0 else self._groups[index-1]
+  def groups(self):
+    return self._groups
+
+class Balanced( object ):
+  """
+  Linear-time extractor for balanced delimiter groups
+
+  Finds a qualifier (a regular expression, e.g., r'\\label') immediately
+  followed by an opening delimiter, and returns everything up to the
+  matching closing delimiter. Delimiters are matched with one stack based
+  scan of the text, so run time is linear in the length of the text even
+  for deeply nested or unbalanced input. Escaped delimiters (e.g., \\{)
+  and delimiters inside comments are ignored; a qualifier whose opening
+  delimiter is never closed does not match.
+
+  The findall() method returns the same values as findall() on a pattern
+  from the old regex based recursiveRegex(): the balanced group, including
+  delimiters, or a tuple of the qualifier's groups followed by the
+  balanced group if the qualifier has groups.
+
+  """
+
+  _cache = (None, None, None)                                                   # (delimiters, text, scan() output) of last scan
+
+  def __init__(self, qualifier, delimiters = ('{', '}',)):
+    self.delimiters = tuple(delimiters)
+    self.qualifier  = re.compile( qualifier + re.escape( self.delimiters[0] ) )
+    self.token      = re.compile( TOKEN.format( *map(re.escape, self.delimiters) ), re.DOTALL )
+
+  def scan(self, text):
+    """
+    Match all delimiters in text and find the control words outside comments
+
+    The result for the last text scanned is cached, so matchers with the
+    same delimiters, e.g., DocIndex and the Balanced patterns, share one
+    scan of a text.
+
+    Arguments:
+      text (str) : Text to scan
+
+    Keyword arguments:
+      None.
+
+    Returns:
+      tuple : Offsets of opening delimiters mapped to offsets of the
+        matching closing delimiters, and list of (name, start, end)
+        tuples of control words
+
+    """
+
+    delimiters, cached, result = Balanced._cache
+    if cached is text and delimiters == self.delimiters:                        # Same text object scanned last time
+      return result
+
+    table = {}
+    words = []
+    stack = []
+    for token in self.token.finditer( text ):
+      char = token.group()
+      if char == self.delimiters[0]:
+        stack.append( token.start() )
+      elif char == self.delimiters[1]:
+        if stack:
+          table[ stack.pop() ] = token.start()
+      elif token.group(1):
+        words.append( (token.group(1), token.start(), token.end()) )
+    result = (table, words)
+    Balanced._cache = (self.delimiters, text, result)
+    return result
+
+  def table(self, text):
+    """Return offsets of opening delimiters mapped to those of the matching closing delimiters"""
+
+    return self.scan( text )[0]
+
+  def finditer(self, text):
+    """Yield non-overlapping BalancedMatch objects in order of appearance"""
+
+    table = self.table( text )
+    pos   = 0
+    for match in self.qualifier.finditer( text ):
+      start = match.end() - 1                                                   # Offset of opening delimiter
+      if match.start() < pos or start not in table:                             # Inside previous match, escaped, or unbalanced
+        continue
+      pos = table[start] + 1
+      yield BalancedMatch( text, match.start(), pos, match.groups() + (text[start:pos],) )
+
+  def findall(self, text):
+    """Return list of balanced groups, or tuples if qualifier has groups"""
+
+    if self.qualifier.groups:
+      return [match.groups() for match in self.finditer( text )]
+    return [match.groups()[-1] for match in self.finditer( text )]
 
 def recursiveRegex( qualifier, delimiters, group = 1 ):
   '''
   Purpose:
-    To create a regex pattern for extracting information
+    To create a pattern for extracting information between
+    balanced delimiters
   Inputs:
     qualifier   : Qualifying text, such as bibliography
     delimieters : Tuple with starting/ending delimiters, such as ('{','}')
   Keywords:
-    None.
+    group       : Kept for compatibility; the balanced group is always
+                   the group after any groups in the qualifier
   Returns:
-    Returns regex pattern
-  Notes about regex pattern:
-    See link for examples  
-      https://www.regular-expressions.info/refrecurse.html
-    In words:
-      Recurusion of a capturing group
-      Find the qualifier string (case-sensitive)
-      Then use the basic pattern b(?>m|(?R))e where b is
-      matching construct, m is what can occur in middle, and e is ending.
-      In this case, m is[^{}], i.e., not one of those characters,
-      or the matching construct. To get around the case where b
-      is all the text preceding the parenthesis, we replace (?R)
-      with (?1), a reference to the first caputure group. This
-      is all placed inside a capture group.
-
-      Note that this capture group will contain the opening and
-      closing {}, so best to do match[1:-1] to get rid of them
+    Returns Balanced instance
+  Notes:
+    The match will contain the opening and closing {}, so best
+    to do match[1:-1] to get rid of them
   '''
-  fmt = "{}({}(?>[^{}{}]|(?{}))*{})" 
-  fmt = fmt.format(qualifier, delimiters[0], *delimiters, group, delimiters[1] )
-  return regex.compile( fmt )
+  return Balanced( qualifier, delimiters )
 
 def getEnvironment( environ ):
   fmt = ENVIRON.format( environ, environ )
-  try:
-    return regex.compile( fmt )
-  except:
-    return re.compile( fmt )
+  return re.compile( fmt )
 
 def removeComments( text ):
   '''
@@ -53,6 +152,185 @@ def removeComments( text ):
   '''
   return COMMENT.sub( '', text )
 
+class SourceMap( object ):
+  """
+  Map offsets in flattened text back to the file and line they came from
+
+  Built by expandInputs(); each segment of the flattened text copied from
+  one source file is stored with its starting offset, file, and line.
+
+  """
+
+  def __init__(self):
+    self.text    = ''
+    self.offsets = []                                                           # Offset of segment in flattened text
+    self.files   = []                                                           # Source file of segment
+    self.lines   = []                                                           # Line number, in source file, of segment start
+
+  def add(self, offset, path, line):
+    if self.offsets and self.offsets[-1] == offset:                             # Empty previous segment
+      self.files[-1], self.lines[-1] = path, line
+    else:
+      self.offsets.append( offset )
+      self.files.append( path )
+      self.lines.append( line )
+
+  def lookup(self, offset):
+    """
+    Get source file and line for an offset in the flattened text
+
+    Arguments:
+      offset (int) : Offset in flattened text
+
+    Keyword arguments:
+      None.
+
+    Returns:
+      tuple : (file, line) with 1-based line number; (None, None) if map
+        is empty
+
+    """
+
+    i = bisect_right( self.offsets, offset ) - 1
+    if i < 0:
+      return None, None
+    return self.files[i], self.lines[i] + self.text.count( '\n', self.offsets[i], offset )
+
+def readFile( path ):
+  """
+  Read a text file through a cache keyed on modification time and size
+
+  Arguments:
+    path (str) : Path to file
+
+  Keyword arguments:
+    None.
+
+  Returns:
+    str : Contents of file
+
+  """
+
+  stat   = os.stat( path )
+  key    = (stat.st_mtime_ns, stat.st_size)
+  cached = FILECACHE.get( path, None )
+  if cached is not None and cached[0] == key:
+    return cached[1]
+  with open(path, 'r') as fid:
+    text = fid.read()
+  FILECACHE[path] = (key, text)
+  return text
+
+def _inComment( text, pos ):
+  """Check if pos is in a comment, i.e., after an unescaped % on its line"""
+
+  return COMMENT.search( text, text.rfind('\n', 0, pos) + 1, pos ) is not None
+
+def _resolveInput( match, root, cwd, base = None ):
+  """
+  Get path to file referenced by an INPUT match
+
+  Following the import package, \\input and \\include in a file loaded
+  with \\import or \\subimport are relative to the import directory,
+  falling back to the root directory if the file is not found there, and
+  \\subimport is relative to the current import directory.
+
+  Arguments:
+    match (re.Match) : Match of the INPUT pattern
+    root (str) : Directory of the root document
+    cwd (str) : Directory of the file containing the command
+
+  Keyword arguments:
+    base (str) : Current import directory; default is root
+
+  Returns:
+    tuple : Path to the file (None if the command is incomplete) and the
+      import directory for commands in that file
+
+  """
+
+  base = base or root
+  cmd, arg1, arg2 = match.groups()
+  if cmd.endswith('import'):                                                    # \import{dir}{file} or \subimport{dir}{file}
+    if arg2 is None: return None, base
+    base = os.path.normpath( os.path.join( base if cmd.startswith('sub') else root, arg1 ) )
+    path = os.path.join( base, arg2 )
+  elif cmd == 'subfile':                                                        # Relative to file containing command
+    path = os.path.join( cwd, arg1 )
+  else:                                                                         # \input and \include relative to import directory
+    path = os.path.join( base, arg1 )
+    if base != root and not os.path.isfile( _texPath(path) ):
+      path = os.path.join( root, arg1 )
+  return _texPath( path ), base
+
+def _texPath( path ):
+  """Normalize path, adding the .tex extension if missing"""
+
+  return os.path.normpath( path if path.endswith('.tex') else path + '.tex' )
+
+def expandInputs( texFile, text = None, gitBranch = None ):
+  '''
+  Name:
+    expandInputs:
+  Purpose:
+    Recursively replace \input{}, \include{}, \subfile{}, \import{}{},
+    and \subimport{}{} commands with the text of the referenced file,
+    in a single pass over each file
+  Inputs:
+    texFile  : Full path to tex file
+    text     : text from the tex file
+  Keywords:
+    gitBranch : The git branch name to pull include/input files from
+  Returns:
+    Tuple of flattened text and SourceMap for the text
+  Notes:
+    Files are read once through an mtime keyed cache. Commands in
+    comments are not expanded, and a file including itself
+    (directly or indirectly) is not expanded again.
+  '''
+  log    = logging.getLogger(__name__)
+  root   = os.path.dirname( texFile )
+  chunks = []
+  smap   = SourceMap()
+  size   = [0]                                                                  # Length of flattened text so far
+
+  def expand( path, text, stack, base ):
+    cwd  = os.path.dirname( path )
+    pos  = 0
+    line = 1
+    for match in INPUT.finditer( text ):
+      if _inComment( text, match.start() ):
+        continue
+      child, childBase = _resolveInput( match, root, cwd, base )
+      if child is None or child in stack:
+        if child in stack: log.warning( f'Circular include of {child}, not expanding' )
+        continue
+      if gitBranch is None:
+        if not os.path.isfile( child ): continue
+        childText = readFile( child )
+      else:
+        childText = gitShow( gitBranch, child )
+        if not childText: continue
+
+      smap.add( size[0], path, line )                                           # Text before the command
+      chunks.append( text[pos:match.start()] )
+      size[0] += match.start() - pos
+      line    += text.count( '\n', pos, match.start() )
+
+      expand( child, childText, stack + (child,), childBase )
+      pos   = match.end() if match.group(1).endswith('import') else match.end(2) + 1 # Only import commands take two arguments
+      line += text.count( '\n', match.start(), pos )
+
+    smap.add( size[0], path, line )                                             # Remainder of file
+    chunks.append( text[pos:] )
+    size[0] += len(text) - pos
+
+  if not text:
+    text = readFile( texFile )
+  expand( texFile, text, (texFile,), root )
+  smap.text = ''.join( chunks )
+  return smap.text, smap
+
 def replaceInputs( texFile, text = None, gitBranch = None ):
   '''
   Name:
@@ -66,40 +344,103 @@ def replaceInputs( texFile, text = None, gitBranch = None ):
   Keywords:
     gitBranch : The git branch name to pull include/input files from
   Returns:
-    Updated text
+    Updated text; see expandInputs() for details
   '''
-  cwd   = os.path.dirname( texFile )
-  if not text:
-    with open( texFile, 'r' ) as fid:
-      text = fid.read()
-
-  insts = INPUT.findall(text)
-  for inst in insts:
-    dirPath, filePath = os.path.split( inst[1] )
-    if not os.path.isabs( dirPath ):
-      dirPath = os.path.join( cwd, dirPath )
-    if not filePath.endswith('.tex'):
-      filePath += '.tex'
-    path = os.path.join( dirPath, filePath )
-    if os.path.isfile( path ):
-      if gitBranch is None:
-        with open(path, 'r') as fid:
-          rText = fid.read()
-      else:
-        rText = gitShow( gitBranch, path )
-      text = text.replace( inst[0], rText ) 
-  return text 
+  return expandInputs( texFile, text, gitBranch )[0]
 
-def gitShow( gitBranch, infile ):
-  log  = logging.getLogger(__name__)
-  log.info('Getting {} from git branch {}'.format(infile, gitBranch))
-  base = os.path.basename(infile)
-  proc = Popen( ['git', 'show', '{}:./{}'.format(gitBranch, base)], 
-           cwd = os.path.dirname(infile), stdout = PIPE)
+class GitBlobReader( object ):
+  """
+  Read files from git revisions over one long-lived 'git cat-file --batch'
+
+  One reader is kept per repository (see gitReader()), so fetching every
+  file of a revision costs one process spawn instead of one per file.
+
+  """
+
+  def __init__(self, root):
+    self.log  = logging.getLogger(__name__)
+    self.root = root
+    self.lock = Lock()
+    self.proc = None
+
+  def _start(self):
+    self.proc = Popen( ['git', 'cat-file', '--batch'], cwd = self.root,
+                       stdin = PIPE, stdout = PIPE, stderr = DEVNULL )
+
+  def read(self, rev, path):
+    """
+    Read the contents of a file at a given revision
 
-  txt = proc.stdout.read().decode()
+    Arguments:
+      rev (str) : Branch, tag, or commit
+      path (str) : Path to the file in the working tree
 
-  proc.wait()
+    Keyword arguments:
+      None.
 
-  return removeComments( txt ) 
+    Returns:
+      bytes : Contents of the file; None if it does not exist in rev
+
+    """
+
+    rel = os.path.relpath( os.path.abspath(path), self.root ).replace( os.sep, '/' )
+    with self.lock:
+      if self.proc is None or self.proc.poll() is not None:                     # Start, or restart, the process
+        self._start()
+      self.proc.stdin.write( f'{rev}:{rel}\n'.encode() )
+      self.proc.stdin.flush()
+      header = self.proc.stdout.readline().rsplit( None, 2 )                    # <sha> <type> <size>, or <object> missing; object
+      if header[-1:] in ([b'missing'], [b'ambiguous']) or len(header) != 3 or not header[2].isdigit(): # name may contain spaces
+        self.log.error( f'{rel} not found in git revision {rev}' )
+        return None
+      data = self.proc.stdout.read( int(header[2]) )
+      self.proc.stdout.read( 1 )                                                # Trailing newline
+    return data
+
+  def close(self):
+    with self.lock:
+      if self.proc is not None and self.proc.poll() is None:
+        self.proc.stdin.close()
+        self.proc.wait()
+      self.proc = None
+
+def gitRoot( path ):
+  """Return top level directory of git work tree containing path; None if not in one"""
+
+  path = os.path.dirname( os.path.abspath(path) )
+  while True:
+    if os.path.exists( os.path.join(path, '.git') ):
+      return path
+    parent = os.path.dirname( path )
+    if parent == path:
+      return None
+    path = parent
+
+def gitReader( path ):
+  """Get the shared GitBlobReader for the repository containing path"""
+
+  root = gitRoot( path )
+  if root is None:
+    return None
+  with GITLOCK:
+    if root not in GITREADERS:
+      GITREADERS[root] = GitBlobReader( root )
+    return GITREADERS[root]
+
+@atexit.register
+def _closeGitReaders():
+  for reader in GITREADERS.values():
+    reader.close()
+
+def gitShow( gitBranch, infile ):
+  log  = logging.getLogger(__name__)
+  log.info('Getting {} from git branch {}'.format(infile, gitBranch))
+  reader = gitReader( infile )
+  if reader is None:
+    log.error( f'Not in a git repository: {infile}' )
+    return ''
 
+  txt = reader.read( gitBranch, infile )
+  if txt is None:
+    return ''
+  return removeComments( txt.decode() )
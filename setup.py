@@ -14,11 +14,12 @@ setuptools.setup(
   author_email     = "wodzicki@tamu.com",
   version          = main_ns['__version__'],
   packages         = setuptools.find_packages(),
-  install_requires = [ "pandoc", "regex", "pylatexenc", "watchdog" ],
+  install_requires = [ "pandoc", "pylatexenc", "watchdog" ],
   scripts          = ['bin/LaTeX2docx',
                       'bin/ris2bib',
                       'bin/refList',
                       'bin/compileLaTeX',
-                      'bin/autoCompile'],
+                      'bin/autoCompile',
+                      'bin/batchCompile'],
   zip_safe         = False,
 );
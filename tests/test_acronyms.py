@@ -0,0 +1,38 @@
+"""
+Cache parsed acronym definitions of several versions of one document
+"""
+
+import pytest
+
+from pyLaTeX import acronyms, cache
+
+CURRENT = '\\DeclareAcronym{nasa}{short = NASA, long = National Aeronautics and Space Administration}\n'
+OLD     = '\\DeclareAcronym{esa}{short = ESA, long = European Space Agency}\n'
+
+@pytest.fixture
+def texfile( tmp_path, monkeypatch ):
+  """Document file, with acronym caches in a temporary directory"""
+
+  monkeypatch.setattr( cache, 'CACHEDIR', str(tmp_path / 'cache') )
+  acronyms._CACHE.clear()
+  path = tmp_path / 'main.tex'
+  path.write_text( CURRENT )
+  yield str(path)
+  acronyms._CACHE.clear()
+
+def test_versions_share_disk_cache( texfile, monkeypatch ):
+  assert list( acronyms.loadAcronyms( texfile, CURRENT ) ) == ['nasa']
+  assert list( acronyms.loadAcronyms( texfile, OLD ) )     == ['esa']          # e.g., text from a git revision
+
+  acronyms._CACHE.clear()                                                       # New process; only disk cache left
+  monkeypatch.setattr( acronyms, 'parseAcronyms', lambda text: pytest.fail('parsed again') )
+  assert list( acronyms.loadAcronyms( texfile, CURRENT ) ) == ['nasa']
+  assert list( acronyms.loadAcronyms( texfile, OLD ) )     == ['esa']
+
+def test_file_and_text_versions( texfile, monkeypatch ):
+  assert list( acronyms.loadAcronyms( texfile ) )      == ['nasa']
+  assert list( acronyms.loadAcronyms( texfile, OLD ) ) == ['esa']
+
+  acronyms._CACHE.clear()
+  monkeypatch.setattr( acronyms, 'parseAcronyms', lambda text: pytest.fail('parsed again') )
+  assert list( acronyms.loadAcronyms( texfile ) )      == ['nasa']
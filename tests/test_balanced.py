@@ -0,0 +1,56 @@
+"""
+Compare utils.Balanced with the regex based recursive patterns it replaced
+
+The old patterns did not know about escaped delimiters or comments, so the
+random inputs contain neither; on such input both must return the same
+matches.
+"""
+
+import random
+
+import pytest
+
+from pyLaTeX.utils import Balanced
+
+regex = pytest.importorskip( 'regex' )
+
+SEED    = 8                                                                     # Fixed so failures can be reproduced
+SAMPLES = 2000
+PIECES  = ['{', '}', '{', '}', 'a', 'b c', ' ', '\n', '\\label', '\\ref', '\\eqref', '\\label{', '\\ref{',
+           '\\begin{figure}', '\\begin{a}{', '\\begin{']
+CASES   = [(r'\\label',           ('{', '}')),
+           (r'\\(ref|eqref)',     ('{', '}')),
+           (r'\\(?:label|ref)',   ('{', '}')),
+           (r'\\begin{(\w+)}',    ('{', '}'))]
+
+def oldPattern( qualifier, delimiters ):
+  """Pattern built by recursiveRegex() before the Balanced matcher"""
+
+  group = regex.compile( qualifier ).groups + 1
+  fmt   = "{}({}(?>[^{}{}]|(?{}))*{})"
+  fmt   = fmt.format( qualifier, delimiters[0], *delimiters, group, delimiters[1] )
+  return regex.compile( fmt )
+
+def randomText( rng ):
+  """Random text built from qualifiers, delimiters, and filler"""
+
+  return ''.join( rng.choice(PIECES) for _ in range( rng.randint(0, 40) ) )
+
+@pytest.mark.parametrize( 'qualifier,delimiters', CASES )
+def test_findall_matches_regex( qualifier, delimiters ):
+  rng = random.Random( SEED )
+  old = oldPattern( qualifier, delimiters )
+  new = Balanced( qualifier, delimiters )
+  for _ in range( SAMPLES ):
+    text = randomText( rng )
+    assert new.findall( text ) == old.findall( text ), repr(text)
+
+@pytest.mark.parametrize( 'qualifier,delimiters', CASES )
+def test_finditer_spans_match_regex( qualifier, delimiters ):
+  rng = random.Random( SEED + 1 )
+  old = oldPattern( qualifier, delimiters )
+  new = Balanced( qualifier, delimiters )
+  for _ in range( SAMPLES ):
+    text = randomText( rng )
+    assert [m.span() for m in old.finditer( text )] == \
+           [(m.start(), m.end()) for m in new.finditer( text )], repr(text)
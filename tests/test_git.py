@@ -0,0 +1,39 @@
+"""
+Read files from a git revision with GitBlobReader
+"""
+
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from pyLaTeX.utils import GitBlobReader
+
+pytestmark = pytest.mark.skipif( shutil.which('git') is None, reason = 'git not installed' )
+
+@pytest.fixture
+def repo( tmp_path ):
+  """Repository with one commit containing sub/has space.tex"""
+
+  def git( *args ):
+    subprocess.run( ['git', '-c', 'user.name=test', '-c', 'user.email=test@example.com', *args],
+                    cwd = tmp_path, check = True, stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL )
+
+  os.makedirs( tmp_path / 'sub' )
+  (tmp_path / 'sub' / 'has space.tex').write_text( 'old text\n' )
+  git( 'init', '-q' )
+  git( 'add', '-A' )
+  git( 'commit', '-q', '-m', 'initial' )
+  reader = GitBlobReader( str(tmp_path) )
+  yield tmp_path, reader
+  reader.close()
+
+def test_read_path_with_space( repo ):
+  root, reader = repo
+  assert reader.read( 'HEAD', str(root / 'sub' / 'has space.tex') ) == b'old text\n'
+
+def test_missing_path_with_space( repo ):
+  root, reader = repo
+  assert reader.read( 'HEAD', str(root / 'sub' / 'miss ing.tex') ) is None
+  assert reader.read( 'HEAD', str(root / 'sub' / 'has space.tex') ) == b'old text\n' # Reader still in sync
@@ -0,0 +1,44 @@
+"""
+Resolve \\input, \\include, \\import, and \\subimport like LaTeX does
+"""
+
+import pytest
+
+from pyLaTeX.depindex import dependencies, chapters
+from pyLaTeX.utils import expandInputs
+
+@pytest.fixture
+def project( tmp_path ):
+  """Document importing a file that inputs, includes, and subimports others"""
+
+  files = {
+    'main.tex'            : '\\documentclass{book}\n\\begin{document}\n\\import{imp/}{d}\n\\end{document}\n',
+    'imp/d.tex'           : 'D \\input{e} \\subimport{sub/}{f} \\include{chap} \\input{top}\n',
+    'imp/e.tex'           : 'E\n',
+    'imp/chap.tex'        : 'CHAP \\includegraphics{fig}\n',
+    'imp/fig.pdf'         : '',
+    'imp/sub/f.tex'       : 'F \\input{g}\n',
+    'imp/sub/g.tex'       : 'G\n',
+    'top.tex'             : 'TOP\n',                                            # Not in import directory; found in root
+  }
+  for name, text in files.items():
+    path = tmp_path / name
+    path.parent.mkdir( parents = True, exist_ok = True )
+    path.write_text( text )
+  return tmp_path
+
+def test_expand_nested_import( project ):
+  text, _ = expandInputs( str(project / 'main.tex') )
+  for word in ('D', 'E', 'F', 'G', 'CHAP', 'TOP'):
+    assert word in text.split(), word
+  assert '\\input' not in text and '\\subimport' not in text
+
+def test_dependencies_nested_import( project ):
+  files = dependencies( str(project / 'main.tex'), str(project) )
+  for name in ('imp/d.tex', 'imp/e.tex', 'imp/chap.tex', 'imp/fig.pdf', 'imp/sub/f.tex', 'imp/sub/g.tex', 'top.tex'):
+    assert str(project / name) in files, name
+
+def test_chapters_in_import( project ):
+  found = chapters( str(project / 'main.tex') )
+  assert list(found) == ['chap']
+  assert str(project / 'imp' / 'fig.pdf') in found['chap']
@@ -0,0 +1,34 @@
+"""
+Check dependency manifests with recorder.manifestChanged
+"""
+
+import os
+
+from pyLaTeX import recorder
+
+def test_touched_file_refreshed( tmp_path ):
+  path = str(tmp_path / 'refs.bib')
+  with open(path, 'w') as fid:
+    fid.write( '@article{a}\n' )
+  stat     = os.stat( path )
+  manifest = {path : [stat.st_size, stat.st_mtime_ns, recorder.hashFile(path)]}
+
+  os.utime( path, ns = (stat.st_atime_ns, stat.st_mtime_ns + 10**9) )          # Touch without changing content
+  refreshed = []
+  assert recorder.manifestChanged( manifest, refreshed ) is None
+  assert refreshed == [path]
+  assert manifest[path][1] == stat.st_mtime_ns + 10**9
+
+  refreshed = []
+  assert recorder.manifestChanged( manifest, refreshed ) is None
+  assert refreshed == []
+
+def test_changed_file( tmp_path ):
+  path = str(tmp_path / 'refs.bib')
+  with open(path, 'w') as fid:
+    fid.write( '@article{a}\n' )
+  stat     = os.stat( path )
+  manifest = {path : [stat.st_size, stat.st_mtime_ns, recorder.hashFile(path)]}
+  with open(path, 'w') as fid:
+    fid.write( '@article{b}\n' )                                                # Same size, new content
+  assert recorder.manifestChanged( manifest ) == path